@@ -0,0 +1,85 @@
+"""CPU cost of rendering an inspirations list: model path vs. fastjson path.
+
+    python benchmarks/bench_serialization.py --rows 1000 --image-kb 200
+
+The model path reproduces what FastAPI did before: an ``Inspiration`` per
+document, ``response_model`` validation and ``JSONResponse`` rendering. The
+script checks both paths produce identical bytes before timing them.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from fastjson import dumps  # noqa: E402
+from server import Inspiration, _doc_to_inspiration, _doc_to_row  # noqa: E402
+
+
+def synthetic_docs(rows: int, image_kb: int):
+    image = base64.b64encode(os.urandom(image_kb * 768)).decode() if image_kb else None
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            '_id': ObjectId(), 'url': f'https://example.com/{i}', 'title': f'Place {i} – café', 'image_base64': image,
+            'country': 'Indonesia', 'city': 'Bali', 'type': 'cafe' if i % 2 else 'activity', 'theme': ['slow', 'views'],
+            'cost_indicator': '$$', 'vibe_notes': 'Quiet mornings, great light. ' * 4, 'added_by': 'ana',
+            'contributors': ['ana'], 'created_at': start + timedelta(seconds=i, microseconds=(i * 137) % 1000 * 1000),
+        }
+        for i in range(rows)
+    ]
+
+
+def model_path(docs, field) -> bytes:
+    models = [_doc_to_inspiration(d) for d in docs]
+    content = asyncio.run(serialize_response(field=field, response_content=models, is_coroutine=True))
+    return JSONResponse(content).body
+
+
+def fast_path(docs) -> bytes:
+    return dumps([_doc_to_row(d) for d in docs])
+
+
+def cpu_time(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.process_time()
+        fn()
+        best = min(best, time.process_time() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--image-kb', type=int, default=64, help='Decoded size of the inline image per row (0 = none)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    docs = synthetic_docs(args.rows, args.image_kb)
+    field = create_response_field(name='response', type_=List[Inspiration])
+    legacy, fast = model_path(docs, field), fast_path(docs)
+    if legacy != fast:
+        raise SystemExit('fast path output differs from the model path')
+
+    legacy_s = cpu_time(lambda: model_path(docs, field), args.repeat)
+    fast_s = cpu_time(lambda: fast_path(docs), args.repeat)
+    print(f'rows={args.rows} image_kb={args.image_kb} body={len(fast) / 1e6:.1f}MB (outputs identical)')
+    print(f'model path : {legacy_s * 1000:8.1f} ms CPU')
+    print(f'fast path  : {fast_s * 1000:8.1f} ms CPU  ({legacy_s / fast_s:.1f}x less)')
+
+
+if __name__ == '__main__':
+    main()
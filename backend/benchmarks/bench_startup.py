@@ -0,0 +1,138 @@
+"""Cold-start cost of the API: module import and time to first response.
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --mock --output startup.json
+
+Every sample is a fresh interpreter. ``import`` times ``import server``
+alone; ``first_response`` starts uvicorn on ``server:create_app`` and polls
+``/api/health/live`` until it answers, which covers the import, the app
+factory and the lifespan start. Compare two reports with ``--baseline``.
+
+On the dev box, medians of two sets of 21 interleaved ``import server``
+runs: 462 ms before the app factory and 510 ms after it. The app factory
+does not make startup faster. Most of the extra ~45 ms is FastAPI and
+pydantic building the new routes and response models. The new helper
+modules add about 15 ms, and the process pool and compression codecs are
+now imported on first use. Numbers vary by tens of milliseconds between
+runs, so compare interleaved runs only.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import server
+print(time.perf_counter() - t0)
+"""
+
+# Runs uvicorn in-process so --mock can patch the driver before server.py is imported
+SERVE_SNIPPET = """
+import sys
+if sys.argv[2] == "mock":
+    import mongomock_motor, motor.motor_asyncio
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+import uvicorn
+uvicorn.run("server:create_app", factory=True, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def child_env(args) -> Dict[str, str]:
+    env = {**os.environ, 'MONGO_URL': args.mongo_url or 'mongodb://mock', 'DB_NAME': 'verso_bench'}
+    # Startup work that is not the server's own cold start
+    env.update(QUERY_PLAN_CHECK='off', THUMBNAIL_WORKERS='0')
+    if args.mock:
+        # GridFS is not available in mongomock
+        env.update(IMAGE_STORE='local', IMAGE_STORE_DIR=tempfile.gettempdir())
+    return env
+
+
+def time_import(args) -> float:
+    out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=BACKEND_DIR, env=child_env(args), capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def time_first_response(args) -> float:
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', SERVE_SNIPPET, str(port), 'mock' if args.mock else 'mongo'], cwd=BACKEND_DIR, env=child_env(args))
+    try:
+        deadline = t0 + args.timeout
+        while time.perf_counter() < deadline:
+            if proc.poll() is not None:
+                raise SystemExit(f'server exited with code {proc.returncode}')
+            try:
+                if httpx.get(f'http://127.0.0.1:{port}/api/health/live', timeout=1).status_code == 200:
+                    return time.perf_counter() - t0
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.005)
+        raise SystemExit('server did not answer in time')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'min_ms': round(min(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+        'runs': len(samples),
+    }
+
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any]) -> None:
+    for name, row in report.items():
+        old: Optional[Dict[str, Any]] = baseline.get(name)
+        if not old:
+            continue
+        delta = (row['median_ms'] - old['median_ms']) / old['median_ms'] * 100
+        print(f"{name:16} {old['median_ms']:8.1f} -> {row['median_ms']:8.1f} ms  ({delta:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--mock', action='store_true', help='Use mongomock-motor in the server process instead of mongod')
+    parser.add_argument('--mongo-url', help='Local mongod URL for the first-response runs')
+    parser.add_argument('--skip-serve', action='store_true', help='Only time the import')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    args = parser.parse_args()
+    if not args.skip_serve and not (args.mock or args.mongo_url):
+        parser.error('pass --mock or --mongo-url, or --skip-serve')
+
+    report = {'import': summarize([time_import(args) for _ in range(args.runs)])}
+    if not args.skip_serve:
+        report['first_response'] = summarize([time_first_response(args) for _ in range(args.runs)])
+    for name, row in report.items():
+        print(f"{name:16} median {row['median_ms']:8.1f} ms  (min {row['min_ms']:.1f}, max {row['max_ms']:.1f}, {row['runs']} runs)")
+    if args.baseline:
+        compare(json.loads(Path(args.baseline).read_text()), report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
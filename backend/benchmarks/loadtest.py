@@ -0,0 +1,417 @@
+"""Load-test the Verso API against a local Mongo and record a JSON baseline.
+
+    # in-process Mongo stand-in (needs mongomock-motor), nothing else to run
+    python benchmarks/loadtest.py run --mock --inspirations 20000 --output before.json
+
+    # a real local mongod; uses (and drops) the verso_bench database
+    python benchmarks/loadtest.py run --mongo-url mongodb://localhost:27017 --output after.json
+
+    python benchmarks/loadtest.py compare before.json after.json
+
+``run`` starts ``server.py`` under uvicorn in a child process, seeds a
+synthetic dataset through the bulk import path, then drives every read and
+write route in turn with ``--concurrency`` clients for ``--duration``
+seconds each. It reports RPS, p50/p95/p99 latency, error counts and the
+server's peak RSS. The geo routes (``near``, ``within_*``) need a real
+mongod: mongomock has no ``$geoNear`` or ``$geoWithin``. Seeded images are
+real JPEGs encoded with Pillow, so with ``--thumbnail-workers`` above 0 the
+server renders their variants while under load.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BENCH_DB = 'verso_bench'
+THEMES = ['slow', 'views', 'coffee', 'surf', 'temples', 'street food', 'markets', 'hikes']
+
+
+# ----------------------------------------------------------------------------
+# Server process
+# ----------------------------------------------------------------------------
+
+def country_name(c: int) -> str:
+    return f'Country {c}'
+
+
+def city_name(c: int, k: int) -> str:
+    return f'City {c}-{k}'
+
+
+def city_center(c: int, k: int) -> Tuple[float, float]:
+    """Deterministic ``(lat, lng)`` for a synthetic city."""
+    rnd = random.Random(c * 1000 + k)
+    return rnd.uniform(-50, 60), rnd.uniform(-180, 180)
+
+
+def synthetic_rows(args, images: List[str]):
+    rnd = random.Random(args.seed)
+    for i in range(args.inspirations):
+        c, k = rnd.randrange(args.countries), rnd.randrange(args.cities)
+        lat, lng = city_center(c, k)
+        yield i, {
+            'url': f'https://example.com/place/{i}',
+            'title': f'{rnd.choice(THEMES).title()} spot {i}',
+            'image_base64': rnd.choice(images) if images else None,
+            'country': country_name(c),
+            'city': city_name(c, k),
+            'type': rnd.choice(['activity', 'cafe']),
+            'theme': rnd.sample(THEMES, 2),
+            'cost_indicator': rnd.choice(['$', '$$', '$$$']),
+            'vibe_notes': f'{rnd.choice(THEMES)} and {rnd.choice(THEMES)} all afternoon',
+            'added_by': f'user{rnd.randrange(50)}',
+            # Spread over a few km around the city centre
+            'lat': lat + rnd.uniform(-0.05, 0.05),
+            'lng': lng + rnd.uniform(-0.05, 0.05),
+        }
+
+
+def noise_jpeg(rnd: random.Random, kb: int) -> bytes:
+    """A real JPEG of roughly ``kb`` KiB that Pillow (and so the thumbnailer) can decode."""
+    from PIL import Image
+
+    # Random RGB noise at quality 85 encodes to ~0.8 bytes per pixel
+    side = max(16, int((kb * 1024 / 0.8) ** 0.5))
+    im = Image.frombytes('RGB', (side, side), rnd.randbytes(side * side * 3))
+    buf = io.BytesIO()
+    im.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+
+async def seed(server, args) -> None:
+    from importer import aiter_rows
+
+    await server.client.drop_database(server.db.name)
+    # Distinct images so the content-addressed store holds args.image_variants blobs
+    rnd = random.Random(args.seed)
+    images = [
+        base64.b64encode(noise_jpeg(rnd, args.image_kb)).decode()
+        for _ in range(args.image_variants if args.image_kb else 0)
+    ]
+    t0 = time.perf_counter()
+    result = await server.import_inspirations(aiter_rows(synthetic_rows(args, images)))
+    print(f'seeded {result.inserted} inspirations in {time.perf_counter() - t0:.1f}s', file=sys.stderr, flush=True)
+
+
+def serve(args) -> None:
+    """Child process: seed the dataset, then run uvicorn in the same event loop."""
+    if args.mock:
+        import mongomock_motor
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    sys.path.insert(0, str(BACKEND_DIR))
+    import uvicorn
+    import server
+
+    async def main():
+        server.open_resources()
+        await seed(server, args)
+        config = uvicorn.Config(server.create_app(), host='127.0.0.1', port=args.port, log_level='warning', access_log=False)
+        await uvicorn.Server(config).serve()
+
+    asyncio.run(main())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# ----------------------------------------------------------------------------
+# Load generation
+# ----------------------------------------------------------------------------
+
+@dataclass
+class Scenario:
+    name: str
+    request: Callable[[random.Random], Tuple[str, str, Dict[str, Any]]]
+    # Long-lived response: time to the response headers, then disconnect
+    stream: bool = False
+
+
+def scenarios(args, image_urls: List[str]) -> List[Scenario]:
+    def country(r):
+        return country_name(r.randrange(args.countries))
+
+    def place_index(r):
+        return r.randrange(args.countries), r.randrange(args.cities)
+
+    def place(r):
+        c, k = place_index(r)
+        return country_name(c), city_name(c, k)
+
+    def city_items(r):
+        c, city = place(r)
+        return 'GET', f'/api/city/{c}/{city}/items', {'params': {'limit': args.page_size}}
+
+    def city_cards(r):
+        method, path, kwargs = city_items(r)
+        return method, path, {'params': {**kwargs['params'], 'fields': 'id,title,image_url,type,cost_indicator'}}
+
+    def near(r):
+        lat, lng = city_center(*place_index(r))
+        return 'GET', '/api/inspirations/near', {'params': {'lat': lat, 'lng': lng, 'radius_m': 5000}}
+
+    def viewport(r, zoom: int):
+        lat, lng = city_center(*place_index(r))
+        # A 1024x768 px map centred on the city
+        width = 360.0 / 2 ** zoom * 4
+        height = width * 0.75
+        return 'GET', '/api/inspirations/within', {'params': {
+            'west': lng - width / 2, 'east': lng + width / 2,
+            'south': max(-85.0, lat - height / 2), 'north': min(85.0, lat + height / 2),
+            'zoom': zoom,
+        }}
+
+    def add(r):
+        c, city = place(r)
+        return 'POST', '/api/inspirations', {'json': {'url': f'https://example.com/new/{r.random()}', 'country': c, 'city': city, 'type': 'cafe', 'added_by': 'bench'}}
+
+    out = [
+        Scenario('health', lambda r: ('GET', '/api/', {})),
+        Scenario('collections_summary', lambda r: ('GET', '/api/collections/summary', {})),
+        Scenario('cities_within_country', lambda r: ('GET', f'/api/collections/{country(r)}/cities', {})),
+        Scenario('city_items', city_items),
+        Scenario('city_items_cards', city_cards),
+        Scenario('list_inspirations', lambda r: ('GET', '/api/inspirations', {'params': {'country': country(r), 'limit': args.page_size}})),
+        Scenario('search', lambda r: ('GET', '/api/search', {'params': {'q': r.choice(THEMES)}})),
+        Scenario('export_city', lambda r: ('GET', '/api/inspirations/export', {'params': dict(zip(('country', 'city'), place(r)))})),
+        Scenario('add_inspiration', add),
+        Scenario('status_write', lambda r: ('POST', '/api/status', {'json': {'client_name': f'bench{r.randrange(20)}'}})),
+        Scenario('status_list', lambda r: ('GET', '/api/status', {})),
+        Scenario('status_stats', lambda r: ('GET', '/api/status/stats', {'params': {'window': r.choice(['hour', 'day'])}})),
+        Scenario('health_ready', lambda r: ('GET', '/api/health/ready', {})),
+        Scenario('near', near),
+        Scenario('within_pins', lambda r: viewport(r, 14)),
+        Scenario('within_clusters', lambda r: viewport(r, r.choice([3, 6, 9]))),
+        Scenario('stream_connect', lambda r: ('GET', '/api/stream', {'params': dict(zip(('country', 'city'), place(r)))}), stream=True),
+    ]
+    if image_urls:
+        out.append(Scenario('image', lambda r: ('GET', r.choice(image_urls), {})))
+    return out
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, duration: float, seed: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    received = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(wid: int):
+        nonlocal errors, received
+        rnd = random.Random(seed * 1000 + wid)
+        while time.perf_counter() < deadline:
+            method, path, kwargs = scenario.request(rnd)
+            t0 = time.perf_counter()
+            try:
+                if scenario.stream:
+                    async with client.stream(method, path, **kwargs) as resp:
+                        if resp.status_code >= 400:
+                            errors += 1
+                else:
+                    resp = await client.request(method, path, **kwargs)
+                    received += len(resp.content)
+                    if resp.status_code >= 400:
+                        errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'bytes_per_request': int(received / len(latencies)) if latencies else 0,
+    }
+
+
+async def wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'server exited with code {proc.returncode}')
+        try:
+            if (await client.get('/api/')).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit('server did not become ready in time')
+
+
+async def load(args, base_url: str, proc: subprocess.Popen) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        await wait_ready(client, proc, args.ready_timeout)
+        image_urls: List[str] = []
+        if args.image_kb:
+            resp = await client.get(f'/api/city/{country_name(0)}/{city_name(0, 0)}/items', params={'fields': 'image_url', 'limit': 100})
+            image_urls = sorted({row['image_url'] for row in resp.json() if row.get('image_url')})
+        routes: Dict[str, Any] = {}
+        only = set(args.routes.split(',')) if args.routes else None
+        for scenario in scenarios(args, image_urls):
+            if only and scenario.name not in only:
+                continue
+            routes[scenario.name] = await drive(client, scenario, args.concurrency, args.duration, args.seed)
+            r = routes[scenario.name]
+            print(f"{scenario.name:24} {r['rps']:9.1f} rps  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f} ms  errors {r['errors']}", file=sys.stderr, flush=True)
+        return routes
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> None:
+    port = free_port()
+    env = {**os.environ, 'MONGO_URL': args.mongo_url or 'mongodb://mock', 'DB_NAME': BENCH_DB}
+    if not args.cache:
+        env['RESPONSE_CACHE_SIZE'] = '0'
+    # Set explicitly so the report says whether variants were rendered during the run
+    env['THUMBNAIL_WORKERS'] = str(args.thumbnail_workers)
+    with tempfile.TemporaryDirectory() as image_dir:
+        if args.mock:
+            # GridFS is not available in mongomock
+            env.update(IMAGE_STORE='local', IMAGE_STORE_DIR=image_dir)
+        child = [sys.executable, __file__, 'serve', '--port', str(port)] + dataset_argv(args)
+        proc = subprocess.Popen(child, cwd=BACKEND_DIR, env=env)
+        try:
+            routes = asyncio.run(load(args, f'http://127.0.0.1:{port}', proc))
+            rss = peak_rss_mb(proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'backend': 'mongomock' if args.mock else 'mongod',
+            'cache': args.cache,
+            'thumbnail_workers': args.thumbnail_workers,
+            **{k: getattr(args, k) for k in DATASET_ARGS + ('concurrency', 'duration', 'page_size')},
+        },
+        'server': {'peak_rss_mb': round(rss, 1) if rss is not None else None},
+        'routes': routes,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+    print(text)
+
+
+def compare(args) -> None:
+    old, new = (json.loads(Path(p).read_text()) for p in (args.before, args.after))
+
+    def delta(a, b):
+        return f'{(b - a) / a * 100:+6.1f}%' if a else '   n/a'
+
+    print(f"{'route':24} {'rps':>20} {'p95 ms':>22} {'p99 ms':>22}")
+    for name in sorted(set(old['routes']) | set(new['routes'])):
+        a, b = old['routes'].get(name), new['routes'].get(name)
+        if not a or not b:
+            print(f'{name:24} only in {"after" if b else "before"}')
+            continue
+        cols = [f"{b[k]:>10} {delta(a[k], b[k])}" for k in ('rps', 'p95_ms', 'p99_ms')]
+        print(f'{name:24} ' + ' '.join(f'{c:>22}' for c in cols))
+    rss_a, rss_b = old['server'].get('peak_rss_mb'), new['server'].get('peak_rss_mb')
+    if rss_a and rss_b:
+        print(f"{'peak_rss_mb':24} {rss_b:>10} {delta(rss_a, rss_b)}")
+
+
+DATASET_ARGS = ('inspirations', 'countries', 'cities', 'image_kb', 'image_variants', 'seed')
+
+
+def dataset_argv(args) -> List[str]:
+    argv = ['--mock'] if args.mock else ['--mongo-url', args.mongo_url]
+    for name in DATASET_ARGS:
+        argv += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    return argv
+
+
+def add_dataset_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument('--mock', action='store_true', help='Use mongomock-motor in the server process instead of mongod')
+    p.add_argument('--mongo-url', help='Local mongod URL (the verso_bench database is dropped)')
+    p.add_argument('--inspirations', type=int, default=10000)
+    p.add_argument('--countries', type=int, default=10)
+    p.add_argument('--cities', type=int, default=8, help='Cities per country')
+    p.add_argument('--image-kb', type=int, default=32, help='Image payload size per upload (0 = no images)')
+    p.add_argument('--image-variants', type=int, default=50, help='Distinct images shared across the dataset')
+    p.add_argument('--seed', type=int, default=7)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_run = sub.add_parser('run', help='Start the server, seed it and drive load against every route')
+    add_dataset_args(p_run)
+    p_run.add_argument('--concurrency', type=int, default=16)
+    p_run.add_argument('--thumbnail-workers', type=int, default=2, help='Server THUMBNAIL_WORKERS (0 = no variants rendered)')
+    p_run.add_argument('--duration', type=float, default=5.0, help='Seconds of load per route')
+    p_run.add_argument('--page-size', type=int, default=50)
+    p_run.add_argument('--routes', help='Comma-separated scenario names to run (default: all)')
+    p_run.add_argument('--no-cache', dest='cache', action='store_false', help='Disable the response cache')
+    p_run.add_argument('--ready-timeout', type=float, default=600)
+    p_run.add_argument('--output', help='Write the JSON report here')
+    p_run.set_defaults(func=run)
+
+    p_serve = sub.add_parser('serve', help=argparse.SUPPRESS)
+    add_dataset_args(p_serve)
+    p_serve.add_argument('--port', type=int, required=True)
+    p_serve.set_defaults(func=serve)
+
+    p_cmp = sub.add_parser('compare', help='Diff two JSON reports')
+    p_cmp.add_argument('before')
+    p_cmp.add_argument('after')
+    p_cmp.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    if args.command != 'compare' and not (args.mock or args.mongo_url):
+        parser.error('pass --mock or --mongo-url')
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
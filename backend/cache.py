@@ -0,0 +1,182 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Hashable, Iterable, Optional, Tuple
+
+Tag = Hashable
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires: float
+    tags: FrozenSet[Tag]
+    size: int
+
+
+@dataclass
+class _Load:
+    task: "asyncio.Task[Any]"
+    tags: FrozenSet[Tag]
+    stale: bool = False
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    too_large: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+@dataclass
+class ResponseCache:
+    """Bounded TTL + LRU cache for read-route results.
+
+    Bounded both by entry count and by ``max_bytes``, the total size of the
+    cached bodies: a page can be up to ``MAX_PAGE_SIZE`` rows, so the count
+    alone says little about memory. A single value larger than
+    ``max_entry_bytes`` is served but not stored.
+
+    Entries are tagged (e.g. ``("city", country, city)``) so a write can drop
+    exactly the results it affects. Concurrent misses on one key share a
+    single load. A load that is invalidated while in flight still answers its
+    waiters but is not stored.
+    """
+
+    maxsize: int = 1024
+    ttl: float = 30.0
+    max_bytes: int = 64 * 1024 * 1024
+    max_entry_bytes: int = 4 * 1024 * 1024
+    stats: CacheStats = field(default_factory=CacheStats)
+
+    def __post_init__(self):
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._loading: Dict[Hashable, _Load] = {}
+        self._bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0 and self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry.expires <= time.monotonic():
+            self._drop(key)
+            self.stats.expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry.value
+
+    def _drop(self, key: Hashable) -> None:
+        self._bytes -= self._entries.pop(key).size
+
+    def _store(self, key: Hashable, value: Any, tags: FrozenSet[Tag]) -> None:
+        size = _sizeof(value)
+        if size > min(self.max_entry_bytes, self.max_bytes):
+            self.stats.too_large += 1
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = _Entry(value, time.monotonic() + self.ttl, tags, size)
+        self._bytes += size
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], tags: Iterable[Tag] = ()) -> Any:
+        if not self.enabled:
+            return await loader()
+        found, value = self._lookup(key)
+        if found:
+            self.stats.hits += 1
+            return value
+        load = self._loading.get(key)
+        if load is not None:
+            self.stats.coalesced += 1
+        else:
+            self.stats.misses += 1
+            load = _Load(asyncio.ensure_future(loader()), frozenset(tags))
+            self._loading[key] = load
+            load.task.add_done_callback(lambda task, key=key, load=load: self._finish(key, load))
+        # Shield so one cancelled request does not abort the load for everyone else
+        return await asyncio.shield(load.task)
+
+    def _finish(self, key: Hashable, load: _Load) -> None:
+        if self._loading.get(key) is load:
+            del self._loading[key]
+        if not load.stale and not load.task.cancelled() and load.task.exception() is None:
+            self._store(key, load.task.result(), load.tags)
+
+    def invalidate(self, tags: Iterable[Tag]) -> int:
+        tags = frozenset(tags)
+        doomed = [k for k, e in self._entries.items() if e.tags & tags]
+        for k in doomed:
+            self._drop(k)
+        for k, load in list(self._loading.items()):
+            if load.tags & tags:
+                load.stale = True
+                del self._loading[k]
+        self.stats.invalidations += len(doomed)
+        return len(doomed)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        for load in self._loading.values():
+            load.stale = True
+        self._loading.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "loading": len(self._loading),
+            **self.stats.as_dict(),
+        }
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate payload size of a cached value: rendered bodies and their headers."""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+def scope_for(country: Optional[str] = None, city: Optional[str] = None) -> Tag:
+    """The narrowest tag covering a read scoped to ``country``/``city`` (``None`` = unscoped)."""
+    if country and city:
+        return ("city", country, city)
+    if country:
+        return ("country", country)
+    return "all"
+
+
+def tags_for(country: Optional[str] = None, city: Optional[str] = None) -> FrozenSet[Tag]:
+    """Tags for a read scoped to ``country``/``city`` (``None`` = unscoped)."""
+    return frozenset({scope_for(country, city)})
+
+
+def write_tags(country: str, city: str) -> FrozenSet[Tag]:
+    """Every read tag that a write to ``country``/``city`` can affect."""
+    return frozenset({"all", ("country", country), ("city", country, city)})
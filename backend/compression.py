@@ -0,0 +1,92 @@
+"""gzip / brotli compression for JSON responses above a size threshold.
+
+Pure ASGI, like ``MetricsMiddleware``. Only complete responses are touched:
+anything streamed in several body messages (NDJSON exports, images) or that
+already carries a ``Content-Encoding`` passes through unchanged. Brotli is
+preferred when the optional ``brotli`` package is installed and the client
+accepts it.
+"""
+import importlib.util
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Codecs are imported on first use; only their availability is checked here
+HAVE_BROTLI = importlib.util.find_spec("brotli") is not None
+
+COMPRESSIBLE_TYPES = ("application/json",)
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if HAVE_BROTLI else []) + ["gzip"]
+    best = max(candidates, key=lambda e: accepted.get(e, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        # Dynamic bodies: favour speed over the last few percent of ratio
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            import brotli
+
+            return brotli.compress(body, quality=self.brotli_quality)
+        import gzip
+
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        held: Dict[str, dict] = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body message shows whether to compress
+                held["start"] = message
+                return
+            start = held.pop("start", None)
+            if start is None or message["type"] != "http.response.body":
+                if start is not None:
+                    await send(start)
+                return await send(message)
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = start["status"] == 200 and "content-encoding" not in headers and \
+                headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if compressible and encoding and not message.get("more_body") and len(body) >= self.minimum_size:
+                body = self.compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,211 @@
+"""One inspiration per place: URL normalization, the unique index and the merge job.
+
+Saves are keyed on ``(country, city, url_key)`` where ``url_key`` is the
+normalized URL. Saving a place that already exists adds the saver to its
+``contributors`` with ``$addToSet`` instead of inserting a second document.
+
+Documents written before the key existed have no ``url_key`` and are left
+out of the partial unique index until ``merge_duplicates`` has folded their
+duplicates together and given them a key (``python manage.py merge-duplicates``).
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, TYPE_CHECKING, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_INDEX = IndexModel(
+    [("country", ASCENDING), ("city", ASCENDING), ("url_key", ASCENDING)],
+    name="country_city_url_key",
+    unique=True,
+    partialFilterExpression={"url_key": {"$type": "string"}},
+)
+
+# Query parameters that identify the referrer, not the page
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "igsh", "mc_cid", "mc_eid", "ref", "ref_src", "si", "_ga"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# "scheme:" per RFC 3986, but not "host:port"
+SCHEME = re.compile(r"^([a-z][a-z0-9+.-]*):(?!\d)", re.IGNORECASE)
+
+# Fields a surviving document borrows from a merged duplicate when it has none
+FILLABLE_FIELDS = ("title", "image_ref", "image_variants", "image_base64", "cost_indicator", "vibe_notes", "location")
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used for duplicate detection; the stored ``url`` is left as saved.
+
+    Lowercases scheme and host, drops ``www.``, default ports, fragments,
+    tracking parameters and trailing slashes, and sorts the query. A URL
+    without a scheme is taken as ``https``; one without an authority
+    (``mailto:``, ``tel:``) only has its scheme lowercased. Raises
+    ``ValueError`` for URLs ``urlsplit`` cannot parse, such as a bad IPv6 host.
+    """
+    raw = url.strip()
+    scheme_match = SCHEME.match(raw)
+    if scheme_match is None:
+        raw = "https://" + raw
+    elif not raw[scheme_match.end():].startswith("//"):
+        return scheme_match.group(1).lower() + raw[scheme_match.end() - 1:]
+    parts = urlsplit(raw)
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        # Same page over either scheme
+        scheme = "https"
+    host = (parts.hostname or "").lower().removeprefix("www.")
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, DEFAULT_PORTS.get(parts.scheme.lower())) else f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+    )
+    return urlunsplit((scheme, netloc, parts.path.rstrip("/"), urlencode(query), ""))
+
+
+def place_filter(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {"country": doc["country"], "city": doc["city"], "url_key": doc["url_key"]}
+
+
+def upsert_update(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Insert ``doc`` if its place is new, otherwise only add its saver as a contributor."""
+    contributors = doc.get("contributors") or []
+    insert = {k: v for k, v in doc.items() if k != "contributors"}
+    update: Dict[str, Any] = {"$setOnInsert": insert}
+    if contributors:
+        update["$addToSet"] = {"contributors": {"$each": contributors}}
+    else:
+        insert["contributors"] = []
+    return update
+
+
+# ----------------------------------------------------------------------------
+# Merging pre-existing duplicates
+# ----------------------------------------------------------------------------
+
+PENDING_KEY = "url_key_pending"
+
+
+@dataclass
+class MergeResult:
+    keyed: int = 0
+    groups: int = 0
+    removed: int = 0
+    conflicts: int = 0
+    places: Set[Tuple[str, str]] = field(default_factory=set)
+
+
+def merge_documents(docs: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Pick the survivor of a duplicate group and the ``$set`` that folds the rest into it.
+
+    A document that already holds the ``url_key`` wins (it owns the unique
+    index entry); otherwise the oldest does.
+    """
+    docs = sorted(docs, key=lambda d: (d.get("url_key") is None, d.get("created_at") is None, d.get("created_at"), d["_id"]))
+    survivor, others = docs[0], docs[1:]
+    contributors: List[str] = []
+    themes: List[str] = []
+    for d in docs:
+        for name in d.get("contributors") or ([d["added_by"]] if d.get("added_by") else []):
+            if name not in contributors:
+                contributors.append(name)
+        for t in d.get("theme") or []:
+            if t not in themes:
+                themes.append(t)
+    update: Dict[str, Any] = {"contributors": contributors, "theme": themes}
+    for name in FILLABLE_FIELDS:
+        if not survivor.get(name):
+            donor = next((d[name] for d in others if d.get(name)), None)
+            if donor:
+                update[name] = donor
+    return survivor, update
+
+
+async def _assign_pending_keys(db: "AsyncIOMotorDatabase", batch_size: int) -> int:
+    # Staged in a non-indexed field so legacy duplicates cannot trip the unique index
+    ops: List[UpdateOne] = []
+    keyed = 0
+    async for doc in db.inspirations.find({"url_key": {"$exists": False}}, {"url": 1}, batch_size=batch_size):
+        url = doc.get("url") or ""
+        try:
+            key = normalize_url(url)
+        except ValueError:
+            # Saved before URLs were checked; only exact duplicates of it merge
+            logger.warning("Cannot normalize URL %r of %s; keying it as saved", url, doc["_id"])
+            key = url.strip()
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {PENDING_KEY: key}}))
+        if len(ops) >= batch_size:
+            keyed += (await db.inspirations.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        keyed += (await db.inspirations.bulk_write(ops, ordered=False)).modified_count
+    return keyed
+
+
+async def _promote_pending_keys(db: "AsyncIOMotorDatabase", batch_size: int) -> int:
+    ops: List[UpdateOne] = []
+    conflicts = 0
+
+    async def flush():
+        nonlocal conflicts
+        try:
+            await db.inspirations.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # A save raced the job with the same key; the next run merges it
+            conflicts += len(e.details.get("writeErrors", []))
+
+    async for doc in db.inspirations.find({PENDING_KEY: {"$exists": True}}, {PENDING_KEY: 1}, batch_size=batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"url_key": doc[PENDING_KEY]}, "$unset": {PENDING_KEY: ""}}))
+        if len(ops) >= batch_size:
+            await flush()
+            ops = []
+    if ops:
+        await flush()
+    return conflicts
+
+
+async def merge_duplicates(db: "AsyncIOMotorDatabase", batch_size: int = 500) -> MergeResult:
+    """Fold existing duplicate places into one document each and key every document.
+
+    Idempotent; a run interrupted or raced by concurrent saves is finished by
+    running it again. Summaries are not touched here: callers rebuild them.
+    """
+    result = MergeResult()
+    result.keyed = await _assign_pending_keys(db, batch_size)
+    pipeline = [
+        {"$group": {
+            "_id": {"country": "$country", "city": "$city", "key": {"$ifNull": ["$url_key", f"${PENDING_KEY}"]}},
+            "ids": {"$push": "$_id"},
+            "n": {"$sum": 1},
+        }},
+        {"$match": {"n": {"$gt": 1}}},
+    ]
+    async for group in db.inspirations.aggregate(pipeline, allowDiskUse=True):
+        docs = await db.inspirations.find({"_id": {"$in": group["ids"]}}).to_list(None)
+        if len(docs) < 2:
+            continue
+        survivor, update = merge_documents(docs)
+        doomed: List[ObjectId] = [d["_id"] for d in docs if d["_id"] != survivor["_id"]]
+        result.groups += 1
+        result.removed += len(doomed)
+        result.places.add((survivor["country"], survivor["city"]))
+        await db.inspirations.update_one({"_id": survivor["_id"]}, {"$set": update})
+        await db.inspirations.delete_many({"_id": {"$in": doomed}})
+        logger.info("Merged %d duplicates of %s into %s", len(doomed), survivor.get("url"), survivor["_id"])
+    result.conflicts = await _promote_pending_keys(db, batch_size)
+    return result
+
+
+def inserted_indexes(details: Optional[Dict[str, Any]]) -> Set[int]:
+    """Op indexes that upserted a new document, from a bulk write result or error."""
+    return {u["index"] for u in (details or {}).get("upserted", [])}
@@ -0,0 +1,339 @@
+"""Real-time change feed: one upstream source fanned out to SSE subscribers.
+
+The upstream is a single database-level Mongo change stream, filtered to
+inspiration inserts and ``collection_summaries`` changes. On a standalone
+``mongod``, which has no change streams, the hub falls back to:
+
+* in-process pub/sub when it is the only worker: the write path calls
+  ``publish_local`` and no polling is needed;
+* polling when several workers share the database (``shared``, from
+  ``WEB_CONCURRENCY`` > 1), since each worker would otherwise see only its
+  own writes. Every ``POLL_INTERVAL`` the hub checks the ``"all"`` scope
+  version and, when it moved, reads recent inspirations off the
+  ``created`` index and diffs the country summaries.
+
+Events carry an id: the change stream resume token, or a per-process
+sequence number in local mode. A reconnecting client sends it back as
+``Last-Event-ID``. It is replayed from a ring buffer of recent events, or,
+when upstream is a change stream, from a private cursor resumed at the
+token. A client that cannot be caught up, or that falls too far behind,
+gets a ``resync`` event and should refetch what it shows.
+"""
+import asyncio
+import logging
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, List, Optional, Set, TYPE_CHECKING, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from fastjson import dumps
+from summaries import country_row
+from versions import current_version
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+INSPIRATION_ADDED = "inspiration-added"
+SUMMARY_CHANGED = "summary-changed"
+RESYNC = "resync"
+
+CHANGE_PIPELINE = [{"$match": {"$or": [
+    {"ns.coll": "inspirations", "operationType": "insert"},
+    {"ns.coll": "collection_summaries", "operationType": {"$in": ["insert", "update", "replace", "delete"]}},
+]}}]
+# "$changeStream stage is only supported on replica sets"
+NO_CHANGE_STREAMS = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+REPLAY_BUFFER = 1024
+SUBSCRIBER_BUFFER = 256
+MAX_BACKOFF = 30.0
+
+POLL_INTERVAL = 2.0
+# Workers' inserts can become visible out of created_at order; look back this far for stragglers
+POLL_LOOKBACK = timedelta(seconds=10)
+
+
+@dataclass
+class Event:
+    id: str
+    type: str
+    country: Optional[str] = None
+    city: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def encode(self) -> bytes:
+        return b"id: %s\nevent: %s\ndata: %s\n\n" % (self.id.encode(), self.type.encode(), dumps(self.data))
+
+
+class Subscription:
+    """One client's filtered view of the feed; country/city ``None`` means everything."""
+
+    def __init__(self, hub: "EventHub", country: Optional[str], city: Optional[str]):
+        self.hub = hub
+        self.country = country
+        self.city = city
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.backlog: List[Event] = []
+        self.resume_from: Optional[str] = None
+        self.overflowed = False
+
+    def matches(self, event: Event) -> bool:
+        if event.type == RESYNC or self.country is None:
+            return True
+        if event.country != self.country:
+            return False
+        # Summary changes are per country and concern every city in it
+        return self.city is None or event.city is None or event.city == self.city
+
+    def offer(self, event: Optional[Event]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow client is cut loose rather than allowed to hold up the fan-out
+            self.overflowed = True
+
+    async def events(self) -> AsyncIterator[Optional[Event]]:
+        """Replayed then live events; yields ``None`` at heartbeat intervals when idle."""
+        seen: Set[str] = set()
+        if self.resume_from is not None:
+            async for event in self.hub.catch_up(self.resume_from):
+                if self.matches(event):
+                    seen.add(event.id)
+                    yield event
+        for event in self.backlog:
+            if self.matches(event) and event.id not in seen:
+                yield event
+        self.backlog = []
+        while True:
+            if self.overflowed:
+                yield self.hub.resync_event()
+                return
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout=self.hub.heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is None:
+                return
+            if event.id not in seen:
+                yield event
+
+    def close(self) -> None:
+        self.hub.subscribers.discard(self)
+
+
+class EventHub:
+    def __init__(
+        self,
+        db: "AsyncIOMotorDatabase",
+        render: Callable[[Dict[str, Any]], Dict[str, Any]],
+        heartbeat: float = 15.0,
+        shared: bool = False,
+        poll_interval: float = POLL_INTERVAL,
+    ):
+        self.db = db
+        self.render = render
+        self.heartbeat = heartbeat
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self.mode = "starting"
+        self.subscribers: Set[Subscription] = set()
+        self.recent: Deque[Event] = deque(maxlen=REPLAY_BUFFER)
+        self.published = 0
+        self._boot = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._resume: Optional[Dict[str, Any]] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    # ---- subscribers ----
+    def subscribe(self, country: Optional[str] = None, city: Optional[str] = None, last_event_id: Optional[str] = None) -> Subscription:
+        sub = Subscription(self, country, city)
+        if last_event_id:
+            ids = [e.id for e in self.recent]
+            if last_event_id in ids:
+                sub.backlog = list(self.recent)[ids.index(last_event_id) + 1:]
+            elif self.mode == "change_stream" and not last_event_id.startswith("local-"):
+                sub.resume_from = last_event_id
+            else:
+                sub.backlog = [self.resync_event()]
+        self.subscribers.add(sub)
+        return sub
+
+    def resync_event(self) -> Event:
+        # Carries the newest id so the client's next reconnect resumes from here
+        latest = self.recent[-1].id if self.recent else self._local_id()
+        return Event(latest, RESYNC)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "change_stream": 1 if self.mode == "change_stream" else 0,
+            "polling": 1 if self.mode == "poll" else 0,
+        }
+
+    def _publish(self, event: Event) -> None:
+        self.recent.append(event)
+        self.published += 1
+        for sub in list(self.subscribers):
+            if sub.matches(event):
+                sub.offer(event)
+
+    # ---- local fallback ----
+    def _local_id(self) -> str:
+        return f"local-{self._boot}-{self._seq}"
+
+    @property
+    def local(self) -> bool:
+        return self.mode == "local"
+
+    def publish_local(self, event_type: str, country: Optional[str], city: Optional[str], data: Dict[str, Any]) -> None:
+        """Publish from the write path; a no-op while a change stream is the source."""
+        if not self.local:
+            return
+        self._publish_next(event_type, country, city, data)
+
+    def _publish_next(self, event_type: str, country: Optional[str], city: Optional[str], data: Dict[str, Any]) -> None:
+        self._seq += 1
+        self._publish(Event(self._local_id(), event_type, country, city, data))
+
+    def publish_inserted(self, docs: Iterable[Dict[str, Any]]) -> None:
+        for doc in docs:
+            self.publish_local(INSPIRATION_ADDED, doc.get("country"), doc.get("city"), self.render(doc))
+
+    async def publish_summaries(self, countries: Iterable[str]) -> None:
+        if not self.local:
+            return
+        countries = list(countries)
+        found = {d["_id"]: d async for d in self.db.collection_summaries.find({"_id": {"$in": countries}})}
+        for country in countries:
+            self.publish_local(SUMMARY_CHANGED, country, None, self._summary_data(country, found.get(country)))
+
+    # ---- change stream ----
+    def _summary_data(self, country: str, doc: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if doc and doc.get("count", 0) > 0:
+            return country_row(doc)
+        return {"country": country, "count": 0, "contributors": []}
+
+    def _from_change(self, change: Dict[str, Any]) -> Event:
+        token = change["_id"]["_data"]
+        if change["ns"]["coll"] == "inspirations":
+            doc = change["fullDocument"]
+            return Event(token, INSPIRATION_ADDED, doc.get("country"), doc.get("city"), self.render(doc))
+        country = change["documentKey"]["_id"]
+        return Event(token, SUMMARY_CHANGED, country, None, self._summary_data(country, change.get("fullDocument")))
+
+    def _watch(self, resume_after: Optional[Dict[str, Any]]):
+        return self.db.watch(CHANGE_PIPELINE, full_document="updateLookup", resume_after=resume_after)
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with self._watch(self._resume) as stream:
+                    if self.mode != "change_stream":
+                        logger.info("Change feed: following a Mongo change stream")
+                    self.mode = "change_stream"
+                    backoff = 1.0
+                    async for change in stream:
+                        self._resume = change["_id"]
+                        self._publish(self._from_change(change))
+            except OperationFailure as e:
+                if e.code == NO_CHANGE_STREAMS:
+                    break
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Change feed: resume point fell off the oplog; asking clients to resync")
+                    self._resume = None
+                    self._publish(self.resync_event())
+                    continue
+                logger.warning("Change feed: change stream failed (%s); retrying in %.0fs", e, backoff)
+            except PyMongoError as e:
+                logger.warning("Change feed: change stream failed (%s); retrying in %.0fs", e, backoff)
+            except Exception:
+                logger.exception("Change feed: change stream unusable")
+                break
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+        if self.shared:
+            logger.info("Change feed: change streams unavailable, polling for other workers' writes")
+            self.mode = "poll"
+            await self._poll()
+            return
+        logger.info("Change feed: change streams unavailable, using in-process events")
+        self.mode = "local"
+
+    # ---- polling fallback (several workers, no change streams) ----
+    async def _poll(self) -> None:
+        version = await current_version(self.db, "all")
+        latest = await self.db.inspirations.find_one({}, {"created_at": 1}, sort=[("created_at", -1), ("_id", -1)])
+        since = latest["created_at"] if latest else datetime.utcnow()
+        # Already there before this worker started: not news
+        seen, since = await self._poll_inserts(since, {}, publish=False)
+        summaries = await self._summary_docs()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                current = await current_version(self.db, "all")
+                if current.number == version.number:
+                    continue
+                version = current
+                seen, since = await self._poll_inserts(since, seen)
+                summaries = await self._poll_summaries(summaries)
+            except PyMongoError as e:
+                logger.warning("Change feed: poll failed (%s)", e)
+
+    async def _poll_inserts(self, since: datetime, seen: Dict[Any, datetime], publish: bool = True) -> Tuple[Dict[Any, datetime], datetime]:
+        cursor = self.db.inspirations.find({"created_at": {"$gte": since - POLL_LOOKBACK}}, {"image_base64": 0})
+        async for doc in cursor.sort([("created_at", 1), ("_id", 1)]):
+            if doc["_id"] in seen:
+                continue
+            seen[doc["_id"]] = doc["created_at"]
+            since = max(since, doc["created_at"])
+            if publish:
+                self._publish_next(INSPIRATION_ADDED, doc.get("country"), doc.get("city"), self.render(doc))
+        cutoff = since - POLL_LOOKBACK
+        return {k: v for k, v in seen.items() if v >= cutoff}, since
+
+    async def _summary_docs(self) -> Dict[str, Dict[str, Any]]:
+        return {d["_id"]: d async for d in self.db.collection_summaries.find({})}
+
+    async def _poll_summaries(self, before: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        after = await self._summary_docs()
+        for country in sorted(set(before) | set(after)):
+            if before.get(country) != after.get(country):
+                self._publish_next(SUMMARY_CHANGED, country, None, self._summary_data(country, after.get(country)))
+        return after
+
+    async def catch_up(self, token: str) -> AsyncIterator[Event]:
+        """Events after ``token`` that are already in the oplog, via a private cursor."""
+        try:
+            async with self._watch({"_data": token}) as stream:
+                while True:
+                    change = await stream.try_next()
+                    if change is None:
+                        return
+                    yield self._from_change(change)
+        except PyMongoError as e:
+            logger.info("Change feed: cannot resume from client token (%s)", e)
+            yield self.resync_event()
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        for sub in list(self.subscribers):
+            sub.offer(None)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
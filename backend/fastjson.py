@@ -0,0 +1,32 @@
+"""Direct document -> JSON bytes rendering for the hot list routes.
+
+Routes hand plain dicts (already in response-model field order) to
+``dumps`` and return a ``RenderedJSONResponse``; FastAPI skips
+``response_model`` validation for ``Response`` objects, so no per-row model
+is built. The output is byte-identical to FastAPI's default rendering:
+compact separators, raw UTF-8 and naive ISO-8601 datetimes.
+"""
+from typing import Any
+
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - pydantic-core fallback
+    orjson = None
+
+# Serializer compiled once; used when orjson is not installed
+_ANY_JSON = TypeAdapter(Any)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return _ANY_JSON.dump_json(content)
+
+
+class RenderedJSONResponse(Response):
+    """A JSON response whose body has already been rendered to bytes."""
+
+    media_type = "application/json"
@@ -0,0 +1,133 @@
+"""Spatial queries over inspiration coordinates.
+
+Coordinates are stored as a GeoJSON point, ``location: {type: "Point",
+coordinates: [lng, lat]}``, under a ``2dsphere`` index. Documents without
+coordinates are simply absent from the index.
+
+Viewport queries use ``$geoWithin`` polygons. A map viewport is bounded by
+parallels, but polygon edges are great circles, so wide viewports are cut
+into strips with densified top and bottom edges. This also keeps every
+polygon well under a hemisphere and handles viewports that cross the
+antimeridian.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
+
+GEO_INDEX = IndexModel([("location", GEOSPHERE), ("type", ASCENDING)], name="location_2dsphere_type")
+
+MAX_NEAR_RADIUS_M = 200_000
+# Web Mercator stops at about 85.05 degrees; nothing a map shows lies beyond
+MAX_LAT = 85.0
+STRIP_WIDTH = 90.0
+EDGE_STEP = 10.0
+
+# At or above this zoom the viewport returns pins, below it clusters
+CLUSTER_MAX_ZOOM = 12
+# Cells per 256px map tile; 4 gives clusters roughly 64px apart on screen
+CELLS_PER_TILE = 4
+
+
+def point(lat: float, lng: float) -> Dict[str, Any]:
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def coordinates(doc: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
+    """``(lat, lng)`` of a stored document, or ``(None, None)``."""
+    location = doc.get("location") or {}
+    coords = location.get("coordinates")
+    if not coords:
+        return None, None
+    return coords[1], coords[0]
+
+
+def _strip(west: float, south: float, east: float, north: float) -> Dict[str, Any]:
+    steps = max(1, math.ceil((east - west) / EDGE_STEP))
+    lngs = [west + (east - west) * i / steps for i in range(steps + 1)]
+    ring = [[x, south] for x in lngs] + [[x, north] for x in reversed(lngs)]
+    ring.append(ring[0])
+    return {"type": "Polygon", "coordinates": [ring]}
+
+
+def _wrap(lng: float) -> float:
+    return (lng + 180.0) % 360.0 - 180.0 if not -180.0 <= lng <= 180.0 else lng
+
+
+def viewport_filter(west: float, south: float, east: float, north: float) -> Dict[str, Any]:
+    """``$geoWithin`` filter for a map viewport; ``west > east`` means it crosses the antimeridian.
+
+    Longitudes outside [-180, 180] (maps that wrap the world) are normalized.
+    """
+    south, north = max(south, -MAX_LAT), min(north, MAX_LAT)
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    west, east = _wrap(west), _wrap(east)
+    spans = [(west, east)] if west < east else [(west, 180.0), (-180.0, east)]
+    strips: List[Dict[str, Any]] = []
+    for lo, hi in spans:
+        if hi <= lo:
+            continue
+        n = math.ceil((hi - lo) / STRIP_WIDTH)
+        width = (hi - lo) / n
+        strips += [_strip(lo + i * width, south, lo + (i + 1) * width, north) for i in range(n)]
+    clauses = [{"location": {"$geoWithin": {"$geometry": s}}} for s in strips]
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def near_pipeline(lat: float, lng: float, radius_m: float, query: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    return [
+        {"$geoNear": {
+            "near": point(lat, lng),
+            "distanceField": "_distance_m",
+            "maxDistance": radius_m,
+            "query": query,
+            "key": "location",
+            "spherical": True,
+        }},
+        {"$limit": limit},
+        {"$project": {"image_base64": 0}},
+    ]
+
+
+def cell_size(zoom: int) -> float:
+    """Cluster cell edge in degrees for a web map at ``zoom``."""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def cell_range(west: float, south: float, east: float, north: float, zoom: int) -> Tuple[int, int, int, int]:
+    """The viewport widened to whole cluster cells, as cell indices ``(x0, y0, x1, y1)``.
+
+    Nearby viewports at one zoom map to the same range, so their clusters can
+    be cached, and a cluster cut by the viewport edge is counted in full.
+    ``x0 > x1`` still means the range crosses the antimeridian.
+    """
+    size = cell_size(zoom)
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    west, east = _wrap(west), _wrap(east)
+    x0, x1 = math.floor(west / size), math.ceil(east / size)
+    if west > east and x0 <= x1:
+        # Crossing the antimeridian with less than a cell left out: the whole world
+        x0, x1 = math.floor(-180.0 / size), math.ceil(180.0 / size)
+    y0, y1 = math.floor(max(south, -MAX_LAT) / size), math.ceil(min(north, MAX_LAT) / size)
+    return x0, y0, x1, y1
+
+
+def cluster_pipeline(match: Dict[str, Any], zoom: int, limit: int) -> List[Dict[str, Any]]:
+    """Bucket matching points into a zoom-dependent grid, one cluster per occupied cell."""
+    size = cell_size(zoom)
+    lng = {"$arrayElemAt": ["$location.coordinates", 0]}
+    lat = {"$arrayElemAt": ["$location.coordinates", 1]}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"x": {"$floor": {"$divide": [lng, size]}}, "y": {"$floor": {"$divide": [lat, size]}}},
+            "count": {"$sum": 1},
+            "lng": {"$avg": lng},
+            "lat": {"$avg": lat},
+            "id": {"$first": "$_id"},
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
@@ -0,0 +1,203 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional, TYPE_CHECKING, Tuple
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+CHUNK_SIZE = 256 * 1024
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_DATA_URI_RE = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(;[\w-]+=[\w.-]+)*;base64,", re.IGNORECASE)
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+# Only raster types a browser will not run script from; anything else is refused
+IMAGE_TYPES = frozenset({"image/jpeg", "image/png", "image/gif", "image/webp"})
+
+
+# ----------------------------------------------------------------------------
+# Helpers
+# ----------------------------------------------------------------------------
+
+def sniff_content_type(head: bytes) -> str:
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def decode_image(value: str) -> Tuple[bytes, str]:
+    """Decode a raw or ``data:`` URI base64 string into bytes and a sniffed MIME type.
+
+    The MIME type a ``data:`` URI declares is ignored. Raises ``ValueError``
+    when the payload is not valid base64 or not one of ``IMAGE_TYPES``.
+    """
+    m = _DATA_URI_RE.match(value)
+    if m:
+        value = value[m.end():]
+    value = "".join(value.split())
+    try:
+        data = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"image_base64 is not valid base64: {e}") from e
+    if not data:
+        raise ValueError("image_base64 is empty")
+    sniffed = sniff_content_type(data[:16])
+    if sniffed not in IMAGE_TYPES:
+        raise ValueError("image_base64 must be a JPEG, PNG, GIF or WebP image")
+    return data, sniffed
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_url(digest: Optional[str]) -> Optional[str]:
+    return f"/api/images/{digest}" if digest else None
+
+
+@dataclass
+class StoredImage:
+    digest: str
+    content_type: str
+    length: int
+    chunks: AsyncIterator[bytes]
+
+
+# ----------------------------------------------------------------------------
+# Stores
+# ----------------------------------------------------------------------------
+
+class ImageStore(ABC):
+    """Content-addressed blob store. Keys are the sha256 hex digest of the bytes,
+    so storing the same image twice is a no-op.
+
+    ``exists`` only saves a redundant upload; ``_write`` must itself be safe
+    when two callers store the same digest at once.
+    """
+
+    @abstractmethod
+    async def exists(self, digest: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def _write(self, digest: str, data: bytes, content_type: str) -> None:
+        ...
+
+    @abstractmethod
+    async def open(self, digest: str) -> Optional[StoredImage]:
+        ...
+
+    async def put(self, data: bytes, content_type: str) -> str:
+        digest = image_digest(data)
+        if not await self.exists(digest):
+            await self._write(digest, data, content_type)
+        return digest
+
+
+class GridFSImageStore(ImageStore):
+    def __init__(self, db: "AsyncIOMotorDatabase", bucket_name: str = "images"):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def exists(self, digest: str) -> bool:
+        return await self.files.find_one({"filename": digest}, {"_id": 1}) is not None
+
+    async def _write(self, digest: str, data: bytes, content_type: str) -> None:
+        from gridfs.errors import FileExists
+
+        # The digest is the file _id, so a concurrent upload of the same image
+        # fails on the unique _id (or chunk) index instead of adding a copy
+        try:
+            await self.bucket.upload_from_stream_with_id(digest, digest, data, metadata={"contentType": content_type})
+        except FileExists:
+            pass
+
+    async def open(self, digest: str) -> Optional[StoredImage]:
+        doc = await self.files.find_one({"filename": digest}, sort=[("uploadDate", -1)])
+        if not doc:
+            return None
+        stream = await self.bucket.open_download_stream(doc["_id"])
+
+        async def chunks() -> AsyncIterator[bytes]:
+            while True:
+                chunk = await stream.readchunk()
+                if not chunk:
+                    break
+                yield chunk
+
+        content_type = (doc.get("metadata") or {}).get("contentType") or "application/octet-stream"
+        return StoredImage(digest=digest, content_type=content_type, length=doc["length"], chunks=chunks())
+
+
+class LocalImageStore(ImageStore):
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(self._path(digest).is_file)
+
+    async def _write(self, digest: str, data: bytes, content_type: str) -> None:
+        await asyncio.to_thread(self._write_sync, self._path(digest), data)
+
+    @staticmethod
+    def _write_sync(path: Path, data: bytes) -> None:
+        # Write to a temp file and rename: concurrent writers of one digest
+        # each replace the file with identical bytes, readers never see a partial one
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def open(self, digest: str) -> Optional[StoredImage]:
+        path = self._path(digest)
+        try:
+            fh = await asyncio.to_thread(open, path, "rb")
+        except FileNotFoundError:
+            return None
+        length = os.fstat(fh.fileno()).st_size
+        head = await asyncio.to_thread(fh.read, CHUNK_SIZE)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                chunk = head
+                while chunk:
+                    yield chunk
+                    chunk = await asyncio.to_thread(fh.read, CHUNK_SIZE)
+            finally:
+                fh.close()
+
+        return StoredImage(digest=digest, content_type=sniff_content_type(head[:16]), length=length, chunks=chunks())
+
+
+def image_store_from_env(db: "AsyncIOMotorDatabase") -> ImageStore:
+    kind = os.environ.get("IMAGE_STORE", "gridfs").lower()
+    if kind == "local":
+        return LocalImageStore(Path(os.environ.get("IMAGE_STORE_DIR", Path(__file__).parent / "images")))
+    if kind == "gridfs":
+        return GridFSImageStore(db)
+    raise RuntimeError(f"Unknown IMAGE_STORE backend: {kind!r}")
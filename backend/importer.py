@@ -0,0 +1,104 @@
+"""Row readers for bulk inspiration imports.
+
+Every reader yields ``(index, row)`` pairs, where ``row`` is either the raw
+dict to validate against ``InspirationCreate`` or a ``RowError`` if the line
+could not be parsed. Readers stream their input and never hold the whole
+file in memory.
+"""
+import csv
+import json
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Tuple, Union
+
+# Columns whose CSV cell holds a list, separated by "|" or ";"
+LIST_COLUMNS = ("theme",)
+# Longest NDJSON line accepted from a stream; rows can inline a base64 image
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+
+class RowError(ValueError):
+    pass
+
+
+Row = Tuple[int, Union[Dict[str, Any], RowError]]
+
+
+def _parse_line(index: int, line: Union[str, bytes, bytearray]) -> Row:
+    try:
+        return index, json.loads(line)
+    except ValueError as e:
+        return index, RowError(f"Invalid JSON: {e}")
+
+
+async def ndjson_rows(chunks: AsyncIterator[bytes], max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Row]:
+    """Split a stream of byte chunks (e.g. ``request.stream()``) into NDJSON rows.
+
+    A line longer than ``max_line_bytes`` becomes a ``RowError`` and the rest
+    of it is discarded as it arrives, so one runaway line cannot grow the
+    buffer without bound.
+    """
+    buffer, index = bytearray(), 0
+    # Inside an over-long line that has already been reported
+    skipping = False
+    async for chunk in chunks:
+        # Only the new bytes can hold a newline; the buffered tail was searched already
+        search = len(buffer)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", search)
+            if end < 0:
+                break
+            if skipping:
+                skipping = False
+            elif end - start > max_line_bytes:
+                yield index, RowError(f"Line longer than {max_line_bytes} bytes")
+                index += 1
+            elif buffer[start:end].strip():
+                yield _parse_line(index, buffer[start:end])
+                index += 1
+            start = search = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            if not skipping:
+                yield index, RowError(f"Line longer than {max_line_bytes} bytes")
+                index += 1
+                skipping = True
+            buffer.clear()
+    if buffer.strip() and not skipping:
+        yield _parse_line(index, buffer)
+
+
+async def aiter_rows(rows: Iterable[Row]) -> AsyncIterator[Row]:
+    for row in rows:
+        yield row
+
+
+def csv_row_to_payload(row: Dict[str, str]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        value = (value or "").strip()
+        if key in LIST_COLUMNS:
+            payload[key] = [v.strip() for v in value.replace(";", "|").split("|") if v.strip()]
+        else:
+            payload[key] = value or None
+    return payload
+
+
+def read_file_rows(path: Path, fmt: str = "auto") -> Iterator[Row]:
+    """Stream rows from a ``.csv`` or ``.ndjson``/``.jsonl`` file."""
+    if fmt == "auto":
+        fmt = "csv" if path.suffix.lower() == ".csv" else "ndjson"
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            for index, row in enumerate(csv.DictReader(fh)):
+                yield index, csv_row_to_payload(row)
+        else:
+            index = 0
+            for line in fh:
+                if line.strip():
+                    yield _parse_line(index, line)
+                    index += 1
+
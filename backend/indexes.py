@@ -0,0 +1,87 @@
+import logging
+from typing import Any, Dict, Iterator, List, TYPE_CHECKING, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from dedupe import DEDUPE_INDEX
+from geo import GEO_INDEX
+from search import SEARCH_INDEX
+from status import ensure_status_indexes
+from summaries import SUMMARY_INDEXES
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# The list indexes end in (created_at desc, _id desc) so keyset-paginated
+# lists are served straight off the index without an in-memory sort.
+INSPIRATION_INDEXES = [
+    IndexModel([("country", ASCENDING), ("city", ASCENDING), ("type", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="country_city_type_created"),
+    IndexModel([("country", ASCENDING), ("city", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="country_city_created"),
+    IndexModel([("country", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="country_created"),
+    IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created"),
+    # Thumbnailing copies variants onto every inspiration sharing an original
+    IndexModel([("image_ref", ASCENDING)], name="image_ref", partialFilterExpression={"image_ref": {"$type": "string"}}),
+    SEARCH_INDEX,
+    DEDUPE_INDEX,
+    GEO_INDEX,
+]
+
+# A probe is (kind, spec): ("find", {"filter": ..., "sort": ...}) or ("aggregate", pipeline)
+Probe = Tuple[str, Any]
+
+
+class QueryPlanError(RuntimeError):
+    pass
+
+
+async def ensure_indexes(db: "AsyncIOMotorDatabase") -> List[str]:
+    names = await db.inspirations.create_indexes(INSPIRATION_INDEXES)
+    names += await db.collection_summaries.create_indexes(SUMMARY_INDEXES)
+    names += await ensure_status_indexes(db)
+    logger.info("Ensured indexes: %s", ", ".join(names))
+    return names
+
+
+def _winning_stages(node: Any, in_winning: bool = False) -> Iterator[str]:
+    if isinstance(node, dict):
+        if in_winning and isinstance(node.get("stage"), str):
+            yield node["stage"]
+        for key, value in node.items():
+            if key == "rejectedPlans":
+                continue
+            yield from _winning_stages(value, in_winning or key == "winningPlan")
+    elif isinstance(node, list):
+        for item in node:
+            yield from _winning_stages(item, in_winning)
+
+
+async def explain_probe(db: "AsyncIOMotorDatabase", probe: Probe) -> Dict[str, Any]:
+    kind, spec = probe
+    if kind == "find":
+        cmd = {"find": "inspirations", **spec}
+    else:
+        cmd = {"aggregate": "inspirations", "pipeline": spec, "cursor": {}}
+    return await db.command({"explain": cmd, "verbosity": "queryPlanner"})
+
+
+async def verify_query_plans(db: "AsyncIOMotorDatabase", probes: Dict[str, Probe], strict: bool = False) -> Dict[str, List[str]]:
+    """Explain each route query and flag any whose winning plan is a COLLSCAN.
+
+    Returns the winning-plan stages per probe; raises ``QueryPlanError`` in
+    strict mode when a probe falls back to a collection scan.
+    """
+    plans: Dict[str, List[str]] = {}
+    scans: List[str] = []
+    for name, probe in probes.items():
+        stages = list(_winning_stages(await explain_probe(db, probe)))
+        plans[name] = stages
+        if "COLLSCAN" in stages:
+            scans.append(name)
+            logger.warning("Query plan for %s uses COLLSCAN: %s", name, " <- ".join(stages))
+        else:
+            logger.info("Query plan for %s: %s", name, " <- ".join(stages))
+    if scans and strict:
+        raise QueryPlanError(f"COLLSCAN in query plans for: {', '.join(scans)}")
+    return plans
@@ -0,0 +1,153 @@
+"""Maintenance commands for the Verso backend.
+
+Run from the backend directory, e.g. ``python manage.py migrate-images``.
+"""
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+
+import typer
+
+from dedupe import merge_duplicates
+from image_store import decode_image
+from importer import aiter_rows, read_file_rows
+from indexes import QueryPlanError
+import server
+from server import BULK_BATCH_SIZE, bootstrap_indexes, content_changed, import_inspirations, logger, refresh_summaries
+from status import rebuild_rollups
+
+T = TypeVar("T")
+
+cli = typer.Typer(no_args_is_help=True)
+
+
+def _run(make_coro: Callable[[], Awaitable[T]], thumbnails: bool = False) -> T:
+    """Open the server's client and image store, run one command, close them.
+
+    Opened here rather than in a CLI callback, so ``--help`` and argument
+    errors need no MONGO_URL. Commands never start the change feed, and only
+    those that render variants get a thumbnailer.
+    """
+    async def _main():
+        server.open_resources(events=False, thumbnails=thumbnails)
+        try:
+            return await make_coro()
+        finally:
+            await server.close_resources()
+
+    return asyncio.run(_main())
+
+
+@cli.command("migrate-images")
+def migrate_images(batch_size: int = typer.Option(100, min=1, help="Documents fetched per round trip")):
+    """Move inline image_base64 payloads into the image store."""
+
+    async def _migrate():
+        moved = failed = 0
+        places = set()
+        projection = {"image_base64": 1, "country": 1, "city": 1}
+        cursor = server.db.inspirations.find({"image_base64": {"$nin": [None, ""]}}, projection, batch_size=batch_size)
+        async for doc in cursor:
+            try:
+                blob, content_type = decode_image(doc["image_base64"])
+            except ValueError as e:
+                logger.warning("Skipping inspiration %s: %s", doc["_id"], e)
+                failed += 1
+                continue
+            digest = await server.image_store.put(blob, content_type)
+            await server.db.inspirations.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"image_ref": digest}, "$unset": {"image_base64": ""}},
+            )
+            places.add((doc["country"], doc["city"]))
+            moved += 1
+        # Served rows now carry image_url instead of the inline payload
+        await content_changed(places)
+        # Empty placeholders carry no image; drop the field so documents stay uniform
+        await server.db.inspirations.update_many({"image_base64": {"$in": [None, ""]}}, {"$unset": {"image_base64": ""}})
+        return moved, failed
+
+    moved, failed = _run(_migrate)
+    typer.echo(f"Migrated {moved} images ({failed} skipped)")
+
+
+@cli.command("generate-thumbnails")
+def generate_thumbnails(batch_size: int = typer.Option(100, min=1, help="Distinct images fetched per round trip")):
+    """Render missing thumb/card/full variants for stored images."""
+
+    async def _backfill():
+        if not server.thumbnailer.enabled:
+            typer.echo("Thumbnailing is disabled (Pillow missing or THUMBNAIL_WORKERS=0)", err=True)
+            raise typer.Exit(code=1)
+        return await server.thumbnailer.backfill(batch_size)
+
+    typer.echo(f"Generated variants for {_run(_backfill, thumbnails=True)} images")
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes_cmd(strict: bool = typer.Option(True, help="Exit non-zero if any route query plan is a COLLSCAN")):
+    """Create the inspirations indexes and verify every route query uses them."""
+    try:
+        plans = _run(lambda: bootstrap_indexes(strict=strict))
+    except QueryPlanError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    for name, stages in plans.items():
+        typer.echo(f"{name}: {' <- '.join(stages)}")
+
+
+@cli.command("rebuild-summaries")
+def rebuild_summaries_cmd():
+    """Recompute the materialized collection_summaries from scratch."""
+    countries = _run(refresh_summaries)
+    typer.echo(f"Rebuilt summaries for {countries} countries")
+
+
+@cli.command("rebuild-status-rollups")
+def rebuild_status_rollups_cmd():
+    """Recompute the hourly/daily status_rollups from the retained status checks."""
+    written = _run(lambda: rebuild_rollups(server.db))
+    typer.echo(f"Rebuilt {written} status rollups")
+
+
+@cli.command("merge-duplicates")
+def merge_duplicates_cmd(batch_size: int = typer.Option(500, min=1, help="Documents keyed per bulk write")):
+    """Fold inspirations saved more than once for the same place into one, then rebuild summaries."""
+
+    async def _merge():
+        result = await merge_duplicates(server.db, batch_size)
+        await refresh_summaries()
+        await content_changed(result.places)
+        return result
+
+    result = _run(_merge)
+    typer.echo(f"Keyed {result.keyed} documents; merged {result.groups} places, removing {result.removed} duplicates")
+    if result.conflicts:
+        typer.echo(f"{result.conflicts} documents collided with concurrent saves; run again to merge them", err=True)
+        raise typer.Exit(code=1)
+
+
+@cli.command("import-inspirations")
+def import_inspirations_cmd(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV (with a header row) or NDJSON file"),
+    fmt: str = typer.Option("auto", "--format", help="csv, ndjson or auto (by file extension)"),
+    batch_size: int = typer.Option(BULK_BATCH_SIZE, min=1, help="Rows per insert_many"),
+):
+    """Stream inspirations from a file into the database in batches."""
+
+    async def _import():
+        result = await import_inspirations(aiter_rows(read_file_rows(path, fmt)), batch_size=batch_size)
+        # Variants for the imported images, rather than leaving them to generate-thumbnails
+        await server.thumbnailer.drain()
+        return result
+
+    result = _run(_import, thumbnails=True)
+    for err in result.errors:
+        typer.echo(f"row {err.index}: {err.error}", err=True)
+    typer.echo(f"Imported {result.inserted} inspirations ({result.merged} merged into existing places, {result.failed} failed)")
+    if result.failed:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,292 @@
+"""Request and Mongo command instrumentation, exposed in Prometheus text format.
+
+``MetricsMiddleware`` times every request per route template and tracks
+response sizes. ``MongoCommandTimer`` is a PyMongo ``CommandListener``. Motor
+runs commands in executor threads but copies the caller's context, so the
+listener can read the current request from a ``ContextVar`` and tag each
+command with the route that issued it.
+
+With several worker processes behind one port a scrape reaches a random
+worker. When ``METRICS_MULTIPROC_DIR`` is set (``serve.py`` does this for
+``--workers`` > 1) every worker periodically writes its state there as
+``<pid>.json`` and ``/metrics`` renders the sum over all files: counters and
+histograms stay monotonic, including the counts of workers that have exited.
+Gauges are per live worker, labelled ``worker``.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def state(self) -> List[Any]:
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+    def render(self, states: Optional[Iterable[List[Any]]] = None) -> List[str]:
+        values: Dict[LabelValues, float] = {}
+        for state in [self.state()] if states is None else states:
+            for key, value in state:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in sorted(values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # per label set: [per-bucket counts..., +Inf count], sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def state(self) -> List[Any]:
+        with self._lock:
+            return [[list(k), list(c), t[0]] for k, (c, t) in self._series.items()]
+
+    def render(self, states: Optional[Iterable[List[Any]]] = None) -> List[str]:
+        series: Dict[LabelValues, Tuple[List[int], float]] = {}
+        for state in [self.state()] if states is None else states:
+            for key, counts, total in state:
+                merged, merged_total = series.get(tuple(key), ([0] * len(counts), 0.0))
+                series[tuple(key)] = ([a + b for a, b in zip(merged, counts)], merged_total + total)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_fmt(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A dict of ``{key: value}`` read at scrape time, rendered as one gauge family labelled by ``key``."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Dict[str, float]]):
+        self.name, self.help, self.read = name, help, read
+
+    def state(self) -> Dict[str, float]:
+        return {k: v for k, v in self.read().items() if isinstance(v, (int, float))}
+
+    def render(self, states: Optional[Dict[str, Dict[str, float]]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if states is None:
+            return lines + [f'{self.name}{{key="{_escape(k)}"}} {_fmt(v)}' for k, v in self.state().items()]
+        for worker, values in sorted(states.items()):
+            lines += [f'{self.name}{{key="{_escape(k)}",worker="{worker}"}} {_fmt(v)}' for k, v in values.items()]
+        return lines
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@dataclass
+class Registry:
+    metrics: List[Any] = field(default_factory=list)
+    collectors: List[Gauge] = field(default_factory=list)
+    # Shared by the workers of one server; None renders this process only
+    directory: Optional[str] = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def flush(self) -> None:
+        """Write this worker's state for the others to aggregate; a no-op in single-process mode."""
+        if not self.directory:
+            return
+        state = {
+            "pid": os.getpid(),
+            "metrics": {m.name: m.state() for m in self.metrics},
+            "gauges": {g.name: g.state() for g in self.collectors},
+        }
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as fh:
+            json.dump(state, fh)
+        os.replace(path + ".tmp", path)
+
+    def _worker_states(self) -> List[Dict[str, Any]]:
+        self.flush()
+        states = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fh:
+                    states.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+        return states
+
+    def render(self) -> str:
+        lines: List[str] = []
+        if not self.directory:
+            for metric in self.metrics:
+                lines += metric.render()
+            for gauge in self.collectors:
+                lines += gauge.render()
+            return "\n".join(lines) + "\n"
+        states = self._worker_states()
+        for metric in self.metrics:
+            lines += metric.render([s["metrics"].get(metric.name, []) for s in states])
+        live = [s for s in states if _alive(s["pid"])]
+        for gauge in self.collectors:
+            lines += gauge.render({str(s["pid"]): s["gauges"].get(gauge.name, {}) for s in live})
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_duration = registry.register(Histogram("verso_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")))
+http_size = registry.register(Histogram("verso_http_response_size_bytes", "HTTP response body size by route template.", ("method", "route"), SIZE_BUCKETS))
+mongo_duration = registry.register(Histogram("verso_mongo_command_duration_seconds", "Mongo command latency by issuing route.", ("command", "collection", "route")))
+mongo_failures = registry.register(Counter("verso_mongo_command_failures_total", "Mongo commands that returned an error.", ("command", "collection", "route")))
+mongo_slow = registry.register(Counter("verso_mongo_slow_commands_total", "Mongo commands slower than MONGO_SLOW_MS.", ("command", "collection", "route")))
+
+
+def gauge_collector(name: str, help: str, read: Callable[[], Dict[str, float]]) -> Gauge:
+    return Gauge(name, help, read)
+
+
+# ----------------------------------------------------------------------------
+# Per-request context
+# ----------------------------------------------------------------------------
+
+@dataclass
+class RequestStats:
+    scope: Dict[str, Any]
+    db_seconds: float = 0.0
+    db_commands: int = 0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def __init__(self, slow_seconds: float = 0.1):
+        self.slow_seconds = slow_seconds
+        # request_id -> collection, carried from the started to the finished event
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        self._collections[event.request_id] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, failed: bool) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        stats = current_request.get()
+        route = stats.route if stats else "background"
+        seconds = event.duration_micros / 1e6
+        mongo_duration.observe(seconds, event.command_name, collection, route)
+        if stats is not None:
+            stats.db_seconds += seconds
+            stats.db_commands += 1
+        if failed:
+            mongo_failures.inc(event.command_name, collection, route)
+        if seconds >= self.slow_seconds:
+            mongo_slow.inc(event.command_name, collection, route)
+            logger.warning("Slow Mongo %s on %s took %.1f ms (route %s)", event.command_name, collection or "-", seconds * 1000, route)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, failed=True)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: no per-request task or body buffering."""
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = [500]
+        size = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if self.server_timing:
+                    app_ms = (time.perf_counter() - start) * 1000
+                    timing = f'app;dur={app_ms:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_commands} commands"'
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            elapsed = time.perf_counter() - start
+            http_duration.observe(elapsed, scope["method"], stats.route, str(status[0]))
+            http_size.observe(size[0], scope["method"], stats.route)
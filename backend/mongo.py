@@ -0,0 +1,144 @@
+"""Motor client configuration from the environment, plus pool monitoring.
+
+All settings are optional ``MONGO_*`` variables in ``backend/.env``:
+
+========================================  ===================  =====================================
+Variable                                  Default              Meaning
+========================================  ===================  =====================================
+MONGO_MAX_POOL_SIZE                       100                  Connections per server
+MONGO_MIN_POOL_SIZE                       0                    Connections kept warm
+MONGO_MAX_IDLE_TIME_MS                    60000                Idle connection lifetime
+MONGO_WAIT_QUEUE_TIMEOUT_MS               2000                 Max wait for a free connection
+MONGO_SERVER_SELECTION_TIMEOUT_MS         5000                 Max wait for a usable server
+MONGO_CONNECT_TIMEOUT_MS                  5000                 TCP connect timeout
+MONGO_SOCKET_TIMEOUT_MS                   30000                Per-operation socket timeout
+MONGO_COMPRESSORS                         (none)               e.g. ``zstd,snappy,zlib``
+MONGO_SUMMARY_READ_PREFERENCE             secondaryPreferred   Read preference for summary routes
+MONGO_SUMMARY_MAX_STALENESS_SECONDS       (none)               Staleness bound for secondary reads
+READY_MAX_DB_LATENCY_MS                   250                  Readiness fails above this ping time
+READY_MAX_POOL_UTILIZATION                0.9                  Readiness fails above this pool use
+========================================  ===================  =====================================
+"""
+import os
+import threading
+from typing import Any, Dict, Mapping
+
+from pymongo import monitoring
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+_INT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 100),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 60000),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", 30000),
+}
+
+
+def client_options(env: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    """Keyword arguments for ``AsyncIOMotorClient``."""
+    options: Dict[str, Any] = {"appname": env.get("MONGO_APP_NAME", "verso-api")}
+    for option, (var, default) in _INT_OPTIONS.items():
+        options[option] = int(env.get(var, default))
+    if env.get("MONGO_COMPRESSORS"):
+        options["compressors"] = env["MONGO_COMPRESSORS"]
+    return options
+
+
+def summary_read_preference(env: Mapping[str, str] = os.environ):
+    name = env.get("MONGO_SUMMARY_READ_PREFERENCE", "secondaryPreferred")
+    if name not in READ_PREFERENCES:
+        raise RuntimeError(f"Unknown MONGO_SUMMARY_READ_PREFERENCE {name!r}; expected one of {', '.join(READ_PREFERENCES)}")
+    if name == "primary":
+        return Primary()
+    staleness = env.get("MONGO_SUMMARY_MAX_STALENESS_SECONDS")
+    return READ_PREFERENCES[name](max_staleness=int(staleness) if staleness else -1)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks connections in use and callers waiting for one, per server pool.
+
+    ``maxPoolSize`` applies to each server's pool separately, so utilization
+    is reported for the busiest pool rather than summed across a replica set.
+    """
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.in_use: Dict[Any, int] = {}
+        self.waiting: Dict[Any, int] = {}
+        self.checkout_failures = 0
+        self._lock = threading.Lock()
+
+    def _add(self, counts: Dict[Any, int], address: Any, delta: int) -> None:
+        counts[address] = counts.get(address, 0) + delta
+
+    def connection_check_out_started(self, event) -> None:
+        with self._lock:
+            self._add(self.waiting, event.address, 1)
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self._add(self.waiting, event.address, -1)
+            self._add(self.in_use, event.address, 1)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self._add(self.waiting, event.address, -1)
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self._add(self.in_use, event.address, -1)
+
+    def pool_closed(self, event) -> None:
+        # The server left the topology; its counts no longer mean anything
+        with self._lock:
+            self.in_use.pop(event.address, None)
+            self.waiting.pop(event.address, None)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            addresses = set(self.in_use) | set(self.waiting)
+            busiest = max(addresses, key=lambda a: (self.in_use.get(a, 0), self.waiting.get(a, 0)), default=None)
+            in_use = self.in_use.get(busiest, 0)
+            return {
+                "in_use": in_use,
+                "waiting": self.waiting.get(busiest, 0),
+                "in_use_total": sum(self.in_use.values()),
+                "waiting_total": sum(self.waiting.values()),
+                "pools": len(addresses),
+                "max_pool_size": self.max_pool_size,
+                "utilization": round(in_use / self.max_pool_size, 3) if self.max_pool_size else 0.0,
+                "checkout_failures": self.checkout_failures,
+            }
+
+    # Remaining pool events carry nothing the probe needs
+    def pool_created(self, event) -> None: ...
+    def pool_ready(self, event) -> None: ...
+    def pool_cleared(self, event) -> None: ...
+    def connection_created(self, event) -> None: ...
+    def connection_ready(self, event) -> None: ...
+    def connection_closed(self, event) -> None: ...
+
+
+def ready_thresholds(env: Mapping[str, str] = os.environ) -> Dict[str, float]:
+    return {
+        "max_db_latency_ms": float(env.get("READY_MAX_DB_LATENCY_MS", 250)),
+        "max_pool_utilization": float(env.get("READY_MAX_POOL_UTILIZATION", 0.9)),
+    }
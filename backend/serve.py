@@ -0,0 +1,94 @@
+"""Run the API with several worker processes.
+
+    python serve.py --workers 4 --port 8001
+    python serve.py --workers 4 --gunicorn        # gunicorn master, uvicorn workers
+
+Each worker builds the app through ``server.create_app`` and opens its own
+Mongo client in the lifespan, after the fork. uvloop and httptools are used
+when installed; otherwise uvicorn's asyncio loop and h11 parser are used and
+a warning is logged.
+
+With more than one worker this sets ``WEB_CONCURRENCY`` (the change feed
+polls for other workers' writes when Mongo has no change streams) and a
+fresh ``METRICS_MULTIPROC_DIR`` so ``/metrics`` sums every worker.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+
+logger = logging.getLogger("serve")
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _loop_and_http():
+    loop = "uvloop" if _available("uvloop") else "asyncio"
+    http = "httptools" if _available("httptools") else "h11"
+    if loop != "uvloop" or http != "httptools":
+        logger.warning("uvloop/httptools not installed; serving with loop=%s http=%s", loop, http)
+    return loop, http
+
+
+def run_uvicorn(args) -> None:
+    import uvicorn
+
+    loop, http = _loop_and_http()
+    uvicorn.run(
+        "server:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        access_log=args.access_log,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+
+
+def run_gunicorn(args) -> None:
+    if not _available("gunicorn"):
+        sys.exit("gunicorn is not installed; drop --gunicorn to use uvicorn's own process manager")
+    loop, http = _loop_and_http()
+    worker = "uvicorn.workers.UvicornWorker" if loop == "uvloop" and http == "httptools" else "uvicorn.workers.UvicornH11Worker"
+    argv = [
+        "gunicorn",
+        "--workers", str(args.workers),
+        "--worker-class", worker,
+        "--bind", f"{args.host}:{args.port}",
+        "--graceful-timeout", str(args.graceful_timeout),
+        # Import server.py once in the master; workers fork with it loaded and open Mongo themselves
+        "--preload",
+        "server:create_app()",
+    ]
+    if args.access_log:
+        argv += ["--access-logfile", "-"]
+    os.execvp(sys.executable, [sys.executable, "-m"] + argv)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--gunicorn", action="store_true", help="Run under a gunicorn master instead of uvicorn's")
+    parser.add_argument("--graceful-timeout", type=int, default=20, help="Seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    # Workers import server.py by name
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    # Inherited by the workers
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    if args.workers > 1 and not os.environ.get("METRICS_MULTIPROC_DIR"):
+        os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="verso-metrics-")
+    (run_gunicorn if args.gunicorn else run_uvicorn)(args)
+
+
+if __name__ == "__main__":
+    main()
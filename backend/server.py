@@ -1,26 +1,114 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Header, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Literal, Dict, Any
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import List, Optional, Literal, Dict, Any, AsyncIterator, Awaitable, Callable, Hashable, Iterable, Set, Tuple
 import uuid
-from datetime import datetime
+import zlib
+import base64
+import binascii
+import json
+import hashlib
+from datetime import datetime, timedelta
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from image_store import DIGEST_RE, IMAGE_TYPES, decode_image, image_digest, image_store_from_env, image_url
+from indexes import ensure_indexes, verify_query_plans
+from summaries import apply_contributors, apply_inspirations, city_summaries, country_summaries, iter_summaries, rebuild_summaries
+from cache import ResponseCache, Tag, scope_for, write_tags
+from fastjson import RenderedJSONResponse, dumps
+from importer import Row, RowError, aiter_rows, ndjson_rows
+from search import FACET_FIELDS, MAX_SEARCH_MATCHES, MAX_SEARCH_OFFSET, search_pipeline
+from thumbnails import DEFAULT_VARIANT, VARIANTS, ThumbnailPipeline
+from metrics import MetricsMiddleware, MongoCommandTimer, gauge_collector, registry
+from mongo import PoolMonitor, client_options, ready_thresholds, summary_read_preference
+from versions import Version, bump_versions, current_version
+from compression import CompressionMiddleware
+from dedupe import inserted_indexes, normalize_url, place_filter, upsert_update
+from events import EventHub
+from geo import CLUSTER_MAX_ZOOM, MAX_NEAR_RADIUS_M, cell_range, cell_size, cluster_pipeline, coordinates, near_pipeline, point, viewport_filter
+from status import WINDOWS, bucket_start, client_stats, record_check
+import asyncio
+import time
+from contextlib import asynccontextmanager
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_SIZE_PATTERN = "^(" + "|".join([*VARIANTS, "original"]) + ")$"
 
-# Create the main app without a prefix
-app = FastAPI()
+# ----------------------------------------------------------------------------
+# Per-process resources
+# ----------------------------------------------------------------------------
+# Opened by the app lifespan, i.e. inside each worker after a pre-fork server
+# has forked (a MongoClient must not be shared across a fork). manage.py and
+# the benchmarks call open_resources()/close_resources() directly.
+client: Any = None
+db: Any = None
+summary_db: Any = None
+image_store: Any = None
+thumbnailer: Optional[ThumbnailPipeline] = None
+response_cache: Optional[ResponseCache] = None
+pool_monitor: Optional[PoolMonitor] = None
+event_hub: Optional[EventHub] = None
+
+def open_resources(events: bool = True, thumbnails: bool = True) -> None:
+    """Create the Mongo client and everything bound to it; a no-op if already open.
+
+    Maintenance commands pass ``events=False`` (no change feed; ``event_hub``
+    stays ``None``) and ``thumbnails=False`` unless they render variants.
+    """
+    global client, db, summary_db, image_store, thumbnailer, response_cache, pool_monitor, event_hub
+    if client is not None:
+        return
+    load_dotenv(ROOT_DIR / '.env')
+    # Imported here, not at module load: only a serving process needs the driver's client machinery
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    options = client_options()
+    mongo_timer = MongoCommandTimer(slow_seconds=float(os.environ.get('MONGO_SLOW_MS', '100')) / 1000)
+    pool_monitor = PoolMonitor(max_pool_size=options['maxPoolSize'])
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[mongo_timer, pool_monitor], **options)
+    db = client[os.environ['DB_NAME']]
+    # Read-heavy summary routes tolerate replica lag (MONGO_SUMMARY_READ_PREFERENCE)
+    summary_db = client.get_database(os.environ['DB_NAME'], read_preference=summary_read_preference())
+
+    # Content-addressed image storage (GridFS by default, IMAGE_STORE=local for disk)
+    image_store = image_store_from_env(db)
+    # Resized WebP/JPEG variants, rendered in a process pool (THUMBNAIL_WORKERS=0 disables)
+    thumbnailer = ThumbnailPipeline(db, image_store, max_workers=int(os.environ.get('THUMBNAIL_WORKERS', '2')) if thumbnails else 0, on_changed=content_changed)
+    # Read-route results, invalidated per country/city on writes (size 0 disables)
+    response_cache = ResponseCache(
+        maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', '1024')),
+        ttl=float(os.environ.get('RESPONSE_CACHE_TTL', '30')),
+        max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+        max_entry_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRY_BYTES', str(4 * 1024 * 1024))),
+    )
+    # One upstream for all subscribers: a change stream, or on a standalone mongod
+    # in-process events (one worker) or polling (WEB_CONCURRENCY > 1)
+    if events:
+        event_hub = EventHub(db, render=_event_row, shared=int(os.environ.get('WEB_CONCURRENCY', '1')) > 1)
+    # Workers sharing a port aggregate /metrics through files here (set by serve.py)
+    registry.directory = os.environ.get('METRICS_MULTIPROC_DIR') or None
+
+async def close_resources() -> None:
+    global client, event_hub
+    if client is None:
+        return
+    if event_hub is not None:
+        await event_hub.close()
+        event_hub = None
+    await thumbnailer.close()
+    client.close()
+    client = None
+    # Final counts of an exiting worker stay in the aggregate
+    registry.flush()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -36,6 +124,22 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusBucket(BaseModel):
+    start: datetime
+    count: int
+    last_seen: datetime
+
+class ClientStatusStats(BaseModel):
+    client_name: str
+    count: int
+    last_seen: datetime
+    buckets: List[StatusBucket]
+
+class StatusStats(BaseModel):
+    window: Literal['hour', 'day']
+    since: datetime
+    clients: List[ClientStatusStats]
+
 class InspirationCreate(BaseModel):
     url: str
     title: Optional[str] = None
@@ -47,14 +151,27 @@ class InspirationCreate(BaseModel):
     cost_indicator: Optional[Literal['$', '$$', '$$$']] = None
     vibe_notes: Optional[str] = None
     added_by: Optional[str] = None
+    lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    lng: Optional[float] = Field(default=None, ge=-180, le=180)
+
+    @model_validator(mode='after')
+    def _both_coordinates(self):
+        if (self.lat is None) != (self.lng is None):
+            raise ValueError("lat and lng must be given together")
+        return self
 
 class Inspiration(BaseModel):
     id: str
     url: str
     title: Optional[str] = None
     image_base64: Optional[str] = None
+    image_ref: Optional[str] = None
+    image_url: Optional[str] = None
+    image_variants: Dict[str, str] = Field(default_factory=dict)
     country: str
     city: str
+    lat: Optional[float] = None
+    lng: Optional[float] = None
     type: Literal['activity', 'cafe']
     theme: List[str] = Field(default_factory=list)
     cost_indicator: Optional[Literal['$', '$$', '$$$']] = None
@@ -63,6 +180,51 @@ class Inspiration(BaseModel):
     contributors: List[str] = Field(default_factory=list)
     created_at: datetime
 
+class BulkRowError(BaseModel):
+    index: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    inserted: int = 0
+    merged: int = Field(default=0, description="Rows whose place already existed; the saver was added as a contributor")
+    failed: int = 0
+    errors: List[BulkRowError] = Field(default_factory=list, description="First BULK_MAX_REPORTED_ERRORS failures")
+
+class SearchHit(Inspiration):
+    score: float
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class SearchFacets(BaseModel):
+    country: List[FacetCount] = Field(default_factory=list)
+    city: List[FacetCount] = Field(default_factory=list)
+    type: List[FacetCount] = Field(default_factory=list)
+    theme: List[FacetCount] = Field(default_factory=list)
+    cost_indicator: List[FacetCount] = Field(default_factory=list)
+
+class SearchResult(BaseModel):
+    total: int = Field(description="Matches counted, up to MAX_SEARCH_MATCHES")
+    total_capped: bool = Field(default=False, description="The match count hit MAX_SEARCH_MATCHES; total and facets cover the best-scoring matches only")
+    items: List[SearchHit] = Field(default_factory=list)
+    facets: SearchFacets
+
+class NearbyHit(Inspiration):
+    distance_m: float
+
+class GeoCluster(BaseModel):
+    lat: float
+    lng: float
+    count: int
+    id: Optional[str] = Field(default=None, description="The inspiration's id when count is 1")
+
+class ViewportResult(BaseModel):
+    clustered: bool
+    truncated: bool = False
+    clusters: List[GeoCluster] = Field(default_factory=list)
+    items: List[Inspiration] = Field(default_factory=list)
+
 class CountrySummary(BaseModel):
     country: str
     count: int
@@ -76,23 +238,410 @@ class CitySummary(BaseModel):
 # Utility
 # ----------------------------------------------------------------------------
 
+def _doc_to_row(doc: Dict[str, Any], image_size: str = DEFAULT_VARIANT) -> Dict[str, Any]:
+    """Plain-dict Inspiration in model field order, ready for fastjson.dumps.
+
+    ``image_url`` points at the ``image_size`` variant once it exists, else the original.
+    """
+    variants = doc.get('image_variants') or {}
+    lat, lng = coordinates(doc)
+    return {
+        'id': str(doc.get('_id')),
+        'url': doc.get('url'),
+        'title': doc.get('title'),
+        'image_base64': doc.get('image_base64'),
+        'image_ref': doc.get('image_ref'),
+        'image_url': image_url(variants.get(image_size) or doc.get('image_ref')),
+        'image_variants': {name: image_url(digest) for name, digest in variants.items()},
+        'country': doc.get('country'),
+        'city': doc.get('city'),
+        'lat': lat,
+        'lng': lng,
+        'type': doc.get('type'),
+        'theme': doc.get('theme', []) or [],
+        'cost_indicator': doc.get('cost_indicator'),
+        'vibe_notes': doc.get('vibe_notes'),
+        'added_by': doc.get('added_by'),
+        'contributors': doc.get('contributors', []) or [],
+        'created_at': doc.get('created_at') or datetime.utcnow(),
+    }
+
 def _doc_to_inspiration(doc: Dict[str, Any]) -> Inspiration:
-    return Inspiration(
-        id=str(doc.get('_id')),
-        url=doc.get('url'),
-        title=doc.get('title'),
-        image_base64=doc.get('image_base64'),
-        country=doc.get('country'),
-        city=doc.get('city'),
-        type=doc.get('type'),
-        theme=doc.get('theme', []) or [],
-        cost_indicator=doc.get('cost_indicator'),
-        vibe_notes=doc.get('vibe_notes'),
-        added_by=doc.get('added_by'),
-        contributors=doc.get('contributors', []) or [],
-        created_at=doc.get('created_at') or datetime.utcnow(),
+    return Inspiration(**_doc_to_row(doc))
+
+# List responses only carry the image reference, never the inline payload
+LIST_PROJECTION = {"image_base64": 0}
+
+# ---- Keyset pagination over (created_at, _id) ----
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+LIST_SORT = [("created_at", -1), ("_id", -1)]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def _encode_cursor(doc: Dict[str, Any], field: str = 'created_at') -> str:
+    raw = json.dumps([doc[field].isoformat(), str(doc['_id'])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor: str, field: str = 'created_at') -> Dict[str, Any]:
+    try:
+        created_at, oid = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        created_at, oid = datetime.fromisoformat(created_at), ObjectId(oid)
+    except (binascii.Error, ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return _after_filter(created_at, oid, field)
+
+def _after_filter(created_at: datetime, oid: ObjectId, field: str = 'created_at') -> Dict[str, Any]:
+    # Strictly after the cursor row in (field desc, _id desc) order
+    return {"$or": [
+        {field: {"$lt": created_at}},
+        {field: created_at, "_id": {"$lt": oid}},
+    ]}
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = sorted(set(requested) - set(Inspiration.model_fields))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+def _projection_for(fields: Optional[List[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return LIST_PROJECTION
+    projection: Dict[str, Any] = {"created_at": 1}  # _id is always returned; both feed the cursor
+    for f in fields:
+        if f in ('image_url', 'image_variants'):
+            projection['image_ref'] = projection['image_variants'] = 1
+        elif f in ('lat', 'lng'):
+            projection['location'] = 1
+        elif f != 'id':
+            projection[f] = 1
+    return projection
+
+def _doc_to_partial(doc: Dict[str, Any], fields: List[str], image_size: str = DEFAULT_VARIANT) -> Dict[str, Any]:
+    row = _doc_to_row(doc, image_size)
+    return {f: row[f] for f in fields}
+
+def _inspiration_filter(country: Optional[str] = None, city: Optional[str] = None, type: Optional[str] = None) -> Dict[str, Any]:
+    q: Dict[str, Any] = {}
+    if country:
+        q['country'] = country
+    if city:
+        q['city'] = city
+    if type:
+        q['type'] = type
+    return q
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (RFC 9110 13.1.2) of an If-None-Match header against ``etag``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag.removeprefix('W/') in [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+
+def _validators(version: Version, key: Hashable) -> Dict[str, str]:
+    # The scope version says whether the data changed; the key digest tells
+    # apart the different pages/projections served from the same scope
+    variant = hashlib.blake2b(repr(key).encode(), digest_size=6).hexdigest()
+    headers = {"ETag": f'W/"{version.number}-{variant}"', "Cache-Control": "no-cache"}
+    if version.last_modified:
+        headers["Last-Modified"] = version.last_modified
+    return headers
+
+async def _conditional_json(
+    request: Request,
+    source: Any,
+    scope: Tag,
+    key: Hashable,
+    load: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]],
+) -> Response:
+    """Serve a cached JSON body with ETag/Last-Modified, or a 304 after one version lookup.
+
+    ``source`` is the database the body is read from, so a replica never
+    hands out a version newer than the data it serves. The version is part
+    of the cache key, which keeps workers coherent without shared state.
+    """
+    version = await current_version(source, scope)
+    headers = _validators(version, key)
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, headers["ETag"])
+    else:
+        since = request.headers.get('if-modified-since')
+        not_modified = bool(since and version.last_modified) and not version.modified_since(since)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    body, extra = await response_cache.get_or_load((*key, version.number), load, {scope})
+    return RenderedJSONResponse(body, headers={**headers, **extra})
+
+async def _paginated_inspirations(request: Request, country: Optional[str], city: Optional[str], type: Optional[str], limit: int, cursor: Optional[str], fields: Optional[str], image_size: str) -> Response:
+    selected = _parse_fields(fields)
+    q = _inspiration_filter(country, city, type)
+    if cursor:
+        q = {"$and": [q, _decode_cursor(cursor)]}
+
+    async def load():
+        docs = await db.inspirations.find(q, _projection_for(selected)).sort(LIST_SORT).limit(limit + 1).to_list(limit + 1)
+        next_cursor = _encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        if selected is None:
+            rows = [_doc_to_row(d, image_size) for d in docs[:limit]]
+        else:
+            rows = [_doc_to_partial(d, selected, image_size) for d in docs[:limit]]
+        return dumps(rows), {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+    key = ("inspirations", country, city, type, limit, cursor, tuple(selected) if selected is not None else None, image_size)
+    return await _conditional_json(request, db, scope_for(country, city), key, load)
+
+async def _prepare_inspiration(payload: InspirationCreate) -> Tuple[Dict[str, Any], Optional[Tuple[bytes, str]]]:
+    """Build the document to insert and the decoded image it references, if any.
+
+    The image is not stored yet: a save that merges into an existing place
+    would leave it unreferenced. Raises ValueError for an undecodable image.
+    """
+    data = payload.dict()
+    raw = data.pop('image_base64', None)
+    lat, lng = data.pop('lat', None), data.pop('lng', None)
+    if lat is not None and lng is not None:
+        data['location'] = point(lat, lng)
+    image = None
+    if raw:
+        image = decode_image(raw)
+        data['image_ref'] = image_digest(image[0])
+        # A re-upload of a known image gets its variants straight away
+        variants = await thumbnailer.known_variants(data['image_ref']) if thumbnailer.enabled else None
+        if variants:
+            data['image_variants'] = variants
+    # Mongo keeps millisecond precision; truncate so the response matches what is stored
+    now = datetime.utcnow()
+    data['_id'] = ObjectId()
+    data['created_at'] = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    data['contributors'] = [data.get('added_by')] if data.get('added_by') else []
+    data['url_key'] = normalize_url(data['url'])
+    return data, image
+
+async def content_changed(places: Iterable[Tuple[str, str]]) -> None:
+    """Drop cached reads and bump ETag versions for every scope the places touch."""
+    tags: Set[Tag] = set()
+    for country, city in places:
+        tags |= write_tags(country, city)
+    await _scopes_changed(tags)
+
+async def _scopes_changed(tags: Set[Tag]) -> None:
+    response_cache.invalidate(tags)
+    await bump_versions(db, tags)
+
+async def refresh_summaries() -> int:
+    """Rebuild collection_summaries from scratch and bump every summary scope it may have changed."""
+    before = set(await db.collection_summaries.distinct('_id'))
+    rebuilt = await rebuild_summaries(db)
+    # Countries that dropped out of the summaries too, so their cached ETags stop matching
+    countries = before | set(await db.collection_summaries.distinct('_id'))
+    await _scopes_changed({scope_for()} | {scope_for(c) for c in countries})
+    return rebuilt
+
+async def _after_insert(docs: List[Dict[str, Any]]) -> None:
+    await apply_inspirations(db, docs)
+    await content_changed({(d['country'], d['city']) for d in docs})
+    if event_hub is not None:
+        event_hub.publish_inserted(docs)
+        await event_hub.publish_summaries({d['country'] for d in docs})
+    for d in docs:
+        if d.get('image_ref') and not d.get('image_variants'):
+            # The pipeline reports every place it updates through content_changed
+            thumbnailer.submit(d['image_ref'])
+
+async def _after_merge(joined: List[Tuple[Dict[str, Any], str]]) -> None:
+    """Account for savers added as contributors to places that already existed."""
+    await apply_contributors(db, [(d['country'], name) for d, name in joined])
+    await content_changed({(d['country'], d['city']) for d, _ in joined})
+    if event_hub is not None:
+        await event_hub.publish_summaries({d['country'] for d, _ in joined})
+
+async def save_inspiration(data: Dict[str, Any], image: Optional[Tuple[bytes, str]] = None) -> Dict[str, Any]:
+    """Insert a new place, or add the saver to the contributors of the existing one.
+
+    One atomic upsert on the (country, city, url_key) unique index. ``image``
+    is stored only when the upsert inserted; if storing it fails the new
+    document is removed again. Returns the stored document as it is after
+    the save.
+    """
+    try:
+        before = await db.inspirations.find_one_and_update(
+            place_filter(data), upsert_update(data), upsert=True, return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        # Lost an insert race for the same place; the retry takes the merge branch
+        before = await db.inspirations.find_one_and_update(place_filter(data), upsert_update(data), return_document=ReturnDocument.BEFORE)
+    if before is None:
+        if image is not None:
+            try:
+                await image_store.put(*image)
+            except BaseException:
+                await db.inspirations.delete_one({'_id': data['_id']})
+                raise
+        await _after_insert([data])
+        return data
+    known = before.get('contributors') or []
+    joined = [name for name in data['contributors'] if name not in known]
+    if joined:
+        await _after_merge([(before, name) for name in joined])
+    return {**before, 'contributors': known + joined}
+
+# ---- Bulk import ----
+BULK_BATCH_SIZE = 500
+BULK_MAX_REPORTED_ERRORS = 1000
+# A batch is flushed early once its decoded images reach this size
+BULK_MAX_BATCH_IMAGE_BYTES = 64 * 1024 * 1024
+
+def _row_error(result: BulkImportResult, index: int, error: str) -> None:
+    result.failed += 1
+    if len(result.errors) < BULK_MAX_REPORTED_ERRORS:
+        result.errors.append(BulkRowError(index=index, error=error))
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}" for err in e.errors())
+
+async def _add_contributor(doc: Dict[str, Any], name: str) -> bool:
+    res = await db.inspirations.update_one(place_filter(doc), {"$addToSet": {"contributors": name}})
+    return res.modified_count == 1
+
+async def _store_images(docs: List[Dict[str, Any]], images: Dict[str, Tuple[bytes, str]]) -> Dict[str, str]:
+    """Store the images of freshly inserted documents; returns the digests that failed, with the error."""
+    failed: Dict[str, str] = {}
+    for digest in {d['image_ref'] for d in docs if d.get('image_ref') in images}:
+        try:
+            await image_store.put(*images[digest])
+        except Exception as e:
+            logger.exception("Storing image %s failed", digest)
+            failed[digest] = f"image could not be stored: {e}"
+    return failed
+
+async def _insert_batch(batch: List[Dict[str, Any]], indexes: List[int], result: BulkImportResult, images: Dict[str, Tuple[bytes, str]]) -> None:
+    # Insert-only upserts: new places are created, existing ones left alone.
+    # The bulk result only says which ops inserted, so savers of existing
+    # places are then added one $addToSet each to learn who actually joined.
+    failed_at: Dict[int, str] = {}
+    ops = [UpdateOne(place_filter(d), {"$setOnInsert": d}, upsert=True) for d in batch]
+    try:
+        details = (await db.inspirations.bulk_write(ops, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        failed_at = {err['index']: err.get('errmsg', 'write error') for err in details.get('writeErrors', [])}
+    for pos, msg in sorted(failed_at.items()):
+        _row_error(result, indexes[pos], msg)
+    created = inserted_indexes(details)
+    inserted = [doc for pos, doc in enumerate(batch) if pos in created]
+    existing = [doc for pos, doc in enumerate(batch) if pos not in created and pos not in failed_at]
+    # Only now is it known which images a new document references; merged
+    # rows would have left theirs unreferenced. Rows whose image cannot be
+    # stored are taken out again rather than left pointing at nothing.
+    unstored = await _store_images(inserted, images)
+    if unstored:
+        lost = [pos for pos, doc in enumerate(batch) if pos in created and doc.get('image_ref') in unstored]
+        await db.inspirations.delete_many({'_id': {'$in': [batch[pos]['_id'] for pos in lost]}})
+        for pos in lost:
+            _row_error(result, indexes[pos], unstored[batch[pos]['image_ref']])
+        inserted = [doc for doc in inserted if doc.get('image_ref') not in unstored]
+    result.inserted += len(inserted)
+    result.merged += len(existing)
+    if inserted:
+        await _after_insert(inserted)
+    candidates = [(d, name) for d in existing for name in d['contributors']]
+    added = await asyncio.gather(*[_add_contributor(d, name) for d, name in candidates])
+    joined = [pair for pair, ok in zip(candidates, added) if ok]
+    if joined:
+        await _after_merge(joined)
+
+async def import_inspirations(rows: AsyncIterator[Row], batch_size: int = BULK_BATCH_SIZE) -> BulkImportResult:
+    """Validate and insert rows in unordered batches, collecting per-row errors."""
+    result = BulkImportResult()
+    batch: List[Dict[str, Any]] = []
+    indexes: List[int] = []
+    # Decoded images wait with their batch until it is known which rows inserted
+    images: Dict[str, Tuple[bytes, str]] = {}
+    image_bytes = 0
+    async for index, raw in rows:
+        try:
+            if isinstance(raw, RowError):
+                raise raw
+            if not isinstance(raw, dict):
+                raise RowError("Row must be a JSON object")
+            data, image = await _prepare_inspiration(InspirationCreate(**raw))
+            batch.append(data)
+            indexes.append(index)
+            if image is not None and data['image_ref'] not in images:
+                images[data['image_ref']] = image
+                image_bytes += len(image[0])
+        except ValidationError as e:
+            _row_error(result, index, _validation_message(e))
+        except ValueError as e:
+            _row_error(result, index, str(e))
+        if len(batch) >= batch_size or image_bytes >= BULK_MAX_BATCH_IMAGE_BYTES:
+            await _insert_batch(batch, indexes, result, images)
+            batch, indexes, images, image_bytes = [], [], {}, 0
+    if batch:
+        await _insert_batch(batch, indexes, result, images)
+    return result
+
+# ---- NDJSON export ----
+EXPORT_BATCH_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+async def _ndjson_stream(rows: AsyncIterator[Dict[str, Any]], batch_size: int, compress: bool) -> AsyncIterator[bytes]:
+    """Render rows as NDJSON, yielding one (optionally gzipped) chunk per batch."""
+    gz = zlib.compressobj(wbits=31) if compress else None
+    buf: List[bytes] = []
+    async for row in rows:
+        buf.append(dumps(row))
+        if len(buf) >= batch_size:
+            chunk = b"\n".join(buf) + b"\n"
+            buf = []
+            yield gz.compress(chunk) if gz else chunk
+    tail = b"\n".join(buf) + b"\n" if buf else b""
+    if gz:
+        tail = gz.compress(tail) + gz.flush()
+    if tail:
+        yield tail
+
+def _export_response(rows: AsyncIterator[Dict[str, Any]], name: str, batch_size: int, compress: bool) -> StreamingResponse:
+    filename = f"{name}.ndjson.gz" if compress else f"{name}.ndjson"
+    return StreamingResponse(
+        _ndjson_stream(rows, batch_size, compress),
+        media_type="application/gzip" if compress else NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
+async def _export_rows(q: Dict[str, Any], include_images: bool, batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+    projection = None if include_images else LIST_PROJECTION
+    async for doc in db.inspirations.find(q, projection, batch_size=batch_size).sort(LIST_SORT):
+        row = _doc_to_row(doc)
+        if include_images and doc.get('image_ref') and not row['image_base64']:
+            # Inline the stored bytes so the export can be re-imported via /inspirations/bulk
+            stored = await image_store.open(doc['image_ref'])
+            if stored is not None:
+                blob = b"".join([chunk async for chunk in stored.chunks])
+                row['image_base64'] = f"data:{stored.content_type};base64,{base64.b64encode(blob).decode()}"
+        yield row
+
+# ---- Change feed ----
+SSE_RETRY_MS = 3000
+
+def _event_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Never push a legacy inline image to every subscriber
+    return {**_doc_to_row(doc), 'image_base64': None}
+
+async def _sse(subscription) -> AsyncIterator[bytes]:
+    # StreamingResponse cancels this generator when the client disconnects
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        async for event in subscription.events():
+            # A comment line keeps idle connections open through proxies
+            yield event.encode() if event is not None else b": ping\n\n"
+    finally:
+        subscription.close()
+
 # ----------------------------------------------------------------------------
 # Routes
 # ----------------------------------------------------------------------------
@@ -100,84 +649,316 @@ def _doc_to_inspiration(doc: Dict[str, Any]) -> Inspiration:
 async def root():
     return {"message": "Verso API"}
 
+@api_router.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """Readiness for the load balancer: DB round trip and connection pool headroom."""
+    limits = ready_thresholds()
+    checks: Dict[str, Any] = {"pool": pool_monitor.snapshot()}
+    problems: List[str] = []
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=limits['max_db_latency_ms'] * 4 / 1000)
+        checks['db_latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        if checks['db_latency_ms'] > limits['max_db_latency_ms']:
+            problems.append("db latency above threshold")
+    except Exception as e:
+        checks['db_latency_ms'] = None
+        problems.append(f"db unreachable: {type(e).__name__}")
+    if checks['pool']['utilization'] > limits['max_pool_utilization']:
+        problems.append("connection pool saturated")
+    if checks['pool']['waiting'] > 0 and checks['pool']['utilization'] >= limits['max_pool_utilization']:
+        problems.append("requests queued for a connection")
+    body = {"status": "fail" if problems else "ok", "problems": problems, **checks, "limits": limits}
+    return RenderedJSONResponse(dumps(body), status_code=503 if problems else 200)
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
     _ = await db.status_checks.insert_one(status_obj.dict())
+    await record_check(db, status_obj.client_name, status_obj.timestamp)
     return status_obj
 
+# Raw checks expire after STATUS_RETENTION_DAYS; see status.py
+STATUS_SORT = [("timestamp", -1), ("_id", -1)]
+STATUS_PROJECTION = {"id": 1, "client_name": 1, "timestamp": 1}
+MAX_STATS_BUCKETS = 24 * 31
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    client_name: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Newest checks first; follow the ``X-Next-Cursor`` header for older pages."""
+    q: Dict[str, Any] = {"client_name": client_name} if client_name is not None else {}
+    if cursor:
+        q = {"$and": [q, _decode_cursor(cursor, 'timestamp')]}
+    docs = await db.status_checks.find(q, STATUS_PROJECTION).sort(STATUS_SORT).limit(limit + 1).to_list(limit + 1)
+    rows = [{'id': d.get('id') or str(d['_id']), 'client_name': d['client_name'], 'timestamp': d['timestamp']} for d in docs[:limit]]
+    headers = {NEXT_CURSOR_HEADER: _encode_cursor(docs[limit - 1], 'timestamp')} if len(docs) > limit else {}
+    return RenderedJSONResponse(dumps(rows), headers=headers)
+
+@api_router.get("/status/stats", response_model=StatusStats)
+async def status_stats(
+    window: Literal['hour', 'day'] = 'hour',
+    buckets: int = Query(default=24, ge=1, le=MAX_STATS_BUCKETS, description="Windows to cover, counting back from the current one"),
+    client_name: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE, description="Most recently seen clients to return"),
+):
+    """Per-client check counts and last-seen times, bucketed by hour or day, from the rollups."""
+    since = bucket_start(datetime.utcnow(), window) - WINDOWS[window] * (buckets - 1)
+    clients = await client_stats(db, window, since, client_name, limit)
+    return RenderedJSONResponse(dumps({"window": window, "since": since, "clients": clients}))
 
 # ---- Inspirations CRUD (minimal for v1) ----
 @api_router.post("/inspirations", response_model=Inspiration)
 async def add_inspiration(payload: InspirationCreate):
-    data = payload.dict()
-    data['created_at'] = datetime.utcnow()
-    data['contributors'] = [data.get('added_by')] if data.get('added_by') else []
-    res = await db.inspirations.insert_one(data)
-    inserted = await db.inspirations.find_one({"_id": res.inserted_id})
-    return _doc_to_inspiration(inserted)
+    try:
+        data, image = await _prepare_inspiration(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _doc_to_inspiration(await save_inspiration(data, image))
+
+_BULK_BODY_SCHEMA = {"type": "array", "items": {"$ref": "#/components/schemas/InspirationCreate"}}
+
+@api_router.post(
+    "/inspirations/bulk",
+    response_model=BulkImportResult,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": _BULK_BODY_SCHEMA},
+        "application/x-ndjson": {"schema": {"$ref": "#/components/schemas/InspirationCreate"}},
+    }}},
+)
+async def bulk_add_inspirations(request: Request):
+    """Insert many inspirations from a JSON array or an NDJSON stream (one object per line)."""
+    content_type = request.headers.get('content-type', '')
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        rows = ndjson_rows(request.stream())
+    else:
+        try:
+            body = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of inspirations")
+        rows = aiter_rows(enumerate(body))
+    return await import_inspirations(rows)
+
+@api_router.get("/inspirations/export", response_class=StreamingResponse)
+async def export_inspirations(
+    country: Optional[str] = None,
+    city: Optional[str] = None,
+    type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$"),
+    added_by: Optional[str] = None,
+    include_images: bool = Query(default=False, description="Inline image bytes as base64 data URIs"),
+    gzip: bool = False,
+    batch_size: int = Query(default=EXPORT_BATCH_SIZE, ge=1, le=10000),
+):
+    """Stream matching inspirations as NDJSON, one Inspiration object per line."""
+    q = _inspiration_filter(country, city, type)
+    if added_by:
+        q['added_by'] = added_by
+    return _export_response(_export_rows(q, include_images, batch_size), "inspirations", batch_size, gzip)
 
 @api_router.get("/inspirations", response_model=List[Inspiration])
-async def list_inspirations(country: Optional[str] = None, city: Optional[str] = None, type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$")):
-    q: Dict[str, Any] = {}
-    if country:
-        q['country'] = country
-    if city:
-        q['city'] = city
-    if type:
-        q['type'] = type
-    docs = await db.inspirations.find(q).sort("created_at", -1).to_list(1000)
-    return [_doc_to_inspiration(d) for d in docs]
+async def list_inspirations(
+    request: Request,
+    country: Optional[str] = None,
+    city: Optional[str] = None,
+    type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(default=None, description="Comma-separated Inspiration fields to return"),
+    image_size: str = Query(default=DEFAULT_VARIANT, pattern=IMAGE_SIZE_PATTERN, description="Variant that image_url points at"),
+):
+    return await _paginated_inspirations(request, country, city, type, limit, cursor, fields, image_size)
 
 # ---- Collections summaries ----
 @api_router.get("/collections/summary", response_model=List[CountrySummary])
-async def collections_summary():
-    pipeline = [
-        {"$group": {"_id": "$country", "count": {"$sum": 1}, "contributors": {"$addToSet": "$added_by"}}},
-        {"$sort": {"count": -1}}
-    ]
-    agg = await db.inspirations.aggregate(pipeline).to_list(1000)
-    out: List[CountrySummary] = []
-    for row in agg:
-        out.append(CountrySummary(country=row.get('_id'), count=row.get('count', 0), contributors=[c for c in (row.get('contributors') or []) if c]))
-    return out
+async def collections_summary(request: Request):
+    async def load():
+        return dumps(await country_summaries(summary_db)), {}
+    return await _conditional_json(request, summary_db, scope_for(), ("collections_summary",), load)
+
+@api_router.get("/collections/export", response_class=StreamingResponse)
+async def export_collections(gzip: bool = False):
+    """Stream every country summary, with its per-city counts, as NDJSON."""
+    return _export_response(iter_summaries(summary_db), "collections", EXPORT_BATCH_SIZE, gzip)
 
 @api_router.get("/collections/{country}/cities", response_model=List[CitySummary])
-async def cities_within_country(country: str):
-    pipeline = [
-        {"$match": {"country": country}},
-        {"$group": {"_id": "$city", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    agg = await db.inspirations.aggregate(pipeline).to_list(1000)
-    out: List[CitySummary] = []
-    for row in agg:
-        out.append(CitySummary(city=row.get('_id'), count=row.get('count', 0)))
-    return out
+async def cities_within_country(request: Request, country: str):
+    async def load():
+        return dumps(await city_summaries(summary_db, country)), {}
+    return await _conditional_json(request, summary_db, scope_for(country), ("cities_within_country", country), load)
 
 @api_router.get("/city/{country}/{city}/items", response_model=List[Inspiration])
-async def city_items(country: str, city: str, type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$")):
-    q: Dict[str, Any] = {"country": country, "city": city}
-    if type:
-        q['type'] = type
-    docs = await db.inspirations.find(q).sort("created_at", -1).to_list(1000)
-    return [_doc_to_inspiration(d) for d in docs]
-
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def city_items(
+    request: Request,
+    country: str,
+    city: str,
+    type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(default=None, description="Comma-separated Inspiration fields to return"),
+    image_size: str = Query(default=DEFAULT_VARIANT, pattern=IMAGE_SIZE_PATTERN, description="Variant that image_url points at"),
+):
+    return await _paginated_inspirations(request, country, city, type, limit, cursor, fields, image_size)
+
+# ---- Geo ----
+MAX_VIEWPORT_ITEMS = 500
+MAX_CLUSTERS = 1000
+
+@api_router.get("/inspirations/near", response_model=List[NearbyHit])
+async def inspirations_near(
+    lat: float = Query(ge=-90, le=90),
+    lng: float = Query(ge=-180, le=180),
+    radius_m: float = Query(default=5000, gt=0, le=MAX_NEAR_RADIUS_M),
+    type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$"),
+    limit: int = Query(default=50, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Inspirations within ``radius_m`` metres of a point, nearest first."""
+    docs = await db.inspirations.aggregate(near_pipeline(lat, lng, radius_m, _inspiration_filter(type=type), limit)).to_list(limit)
+    return RenderedJSONResponse(dumps([{**_doc_to_row(d), 'distance_m': round(d['_distance_m'], 1)} for d in docs]))
+
+@api_router.get("/inspirations/within", response_model=ViewportResult)
+async def inspirations_within(
+    request: Request,
+    west: float,
+    south: float = Query(ge=-90, le=90),
+    east: float = Query(),
+    north: float = Query(ge=-90, le=90),
+    zoom: int = Query(ge=0, le=22),
+    type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$"),
+):
+    """Pins inside a map viewport; below CLUSTER_MAX_ZOOM, grid clusters instead.
+
+    ``west > east`` is a viewport that crosses the antimeridian. Clusters
+    cover the viewport widened to whole grid cells and are cached per zoom
+    and cell range, with an ETag on the ``"all"`` scope version.
+    """
+    if south >= north:
+        raise HTTPException(status_code=400, detail="south must be below north")
+    if zoom < CLUSTER_MAX_ZOOM:
+        x0, y0, x1, y1 = cell_range(west, south, east, north, zoom)
+        size = cell_size(zoom)
+        q = {**viewport_filter(x0 * size, y0 * size, x1 * size, y1 * size), **_inspiration_filter(type=type)}
+
+        async def load():
+            rows = await db.inspirations.aggregate(cluster_pipeline(q, zoom, MAX_CLUSTERS + 1), allowDiskUse=True).to_list(MAX_CLUSTERS + 1)
+            clusters = [
+                {'lat': r['lat'], 'lng': r['lng'], 'count': r['count'], 'id': str(r['id']) if r['count'] == 1 else None}
+                for r in rows[:MAX_CLUSTERS]
+            ]
+            return dumps({'clustered': True, 'truncated': len(rows) > MAX_CLUSTERS, 'clusters': clusters, 'items': []}), {}
+
+        return await _conditional_json(request, db, scope_for(), ("clusters", zoom, type, x0, y0, x1, y1), load)
+    q = {**viewport_filter(west, south, east, north), **_inspiration_filter(type=type)}
+    docs = await db.inspirations.find(q, LIST_PROJECTION).sort(LIST_SORT).limit(MAX_VIEWPORT_ITEMS + 1).to_list(MAX_VIEWPORT_ITEMS + 1)
+    items = [_doc_to_row(d) for d in docs[:MAX_VIEWPORT_ITEMS]]
+    return RenderedJSONResponse(dumps({'clustered': False, 'truncated': len(docs) > MAX_VIEWPORT_ITEMS, 'clusters': [], 'items': items}))
+
+# ---- Change feed ----
+@api_router.get("/stream", response_class=StreamingResponse)
+async def stream_events(
+    request: Request,
+    country: Optional[str] = None,
+    city: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """Server-Sent Events: ``inspiration-added`` and ``summary-changed``, optionally for one country/city.
+
+    Reconnects resume after ``Last-Event-ID``; a ``resync`` event means the
+    client missed events and should refetch.
+    """
+    if city and not country:
+        raise HTTPException(status_code=400, detail="city requires country")
+    subscription = event_hub.subscribe(country, city, last_event_id)
+    return StreamingResponse(
+        _sse(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---- Search ----
+@api_router.get("/search", response_model=SearchResult)
+async def search_inspirations(
+    request: Request,
+    q: str = Query(min_length=1, max_length=200),
+    country: Optional[str] = None,
+    city: Optional[str] = None,
+    type: Optional[str] = Query(default=None, pattern="^(activity|cafe)$"),
+    theme: Optional[str] = None,
+    cost_indicator: Optional[str] = Query(default=None, pattern=r"^\$\$?\$?$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=MAX_SEARCH_OFFSET),
+):
+    """Full-text search over title, theme, place and vibe notes, ranked by relevance."""
+    filters = _inspiration_filter(country, city, type)
+    if theme:
+        filters['theme'] = theme
+    if cost_indicator:
+        filters['cost_indicator'] = cost_indicator
+
+    async def load():
+        rows = await db.inspirations.aggregate(search_pipeline(q, filters, offset, limit)).to_list(1)
+        result = rows[0] if rows else {}
+        total = result.get('total') or [{}]
+        n = total[0].get('n', 0)
+        return dumps({
+            'total': n,
+            'total_capped': n >= MAX_SEARCH_MATCHES,
+            'items': [{**_doc_to_row(d), 'score': d['_score']} for d in result.get('items', [])],
+            'facets': {f: [{'value': str(b['value']), 'count': b['count']} for b in result.get(f, [])] for f in FACET_FIELDS},
+        }), {}
+
+    key = ("search", q, country, city, type, theme, cost_indicator, limit, offset)
+    return await _conditional_json(request, db, scope_for(country, city), key, load)
+
+# ---- Images ----
+@api_router.get("/images/{digest}")
+async def get_image(digest: str, if_none_match: Optional[str] = Header(default=None)):
+    if not DIGEST_RE.match(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    # Content-addressed: a matching tag means the bytes cannot have changed
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    stored = await image_store.open(digest)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    headers["Content-Length"] = str(stored.length)
+    # Blobs stored before uploads were restricted to raster types are never served as markup
+    media_type = stored.content_type if stored.content_type in IMAGE_TYPES else "application/octet-stream"
+    return StreamingResponse(stored.chunks, media_type=media_type, headers=headers)
+
+# ---- Cache ----
+@api_router.get("/cache/stats")
+async def cache_stats():
+    return response_cache.snapshot()
+
+# ---- Metrics ----
+def _snapshot(name: str) -> Callable[[], Dict[str, Any]]:
+    # Resolved per scrape: the resources only exist once the lifespan has opened them
+    def read() -> Dict[str, Any]:
+        resource = globals()[name]
+        return resource.snapshot() if resource is not None else {}
+    return read
+
+registry.collectors.append(gauge_collector("verso_response_cache", "Response cache size and counters.", _snapshot('response_cache')))
+registry.collectors.append(gauge_collector("verso_mongo_pool", "Mongo connection pool usage.", _snapshot('pool_monitor')))
+registry.collectors.append(gauge_collector("verso_change_feed", "SSE subscribers and published events.", _snapshot('event_hub')))
+
+root_router = APIRouter()
+
+@root_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # Configure logging
 logging.basicConfig(
@@ -186,6 +967,138 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+def _query_plan_probes() -> Dict[str, Any]:
+    """The query shapes the routes actually issue, with placeholder values."""
+    sort = dict(LIST_SORT)
+    def page(q: Dict[str, Any]):
+        return ("find", {"filter": q, "sort": sort, "projection": LIST_PROJECTION, "limit": DEFAULT_PAGE_SIZE + 1})
+    return {
+        "list_inspirations": page(_inspiration_filter()),
+        "list_inspirations?country": page(_inspiration_filter("probe")),
+        "city_items": page(_inspiration_filter("probe", "probe")),
+        "city_items?type": page(_inspiration_filter("probe", "probe", "cafe")),
+        "city_items?cursor": page({"$and": [_inspiration_filter("probe", "probe"), _after_filter(datetime(2000, 1, 1), ObjectId())]}),
+        "search_inspirations": ("aggregate", search_pipeline("probe", {}, 0, 20)),
+        "inspirations_near": ("aggregate", near_pipeline(0.0, 0.0, 5000, {}, 50)),
+        "inspirations_within": ("find", {"filter": viewport_filter(100.0, -10.0, 120.0, 10.0), "sort": sort, "projection": LIST_PROJECTION, "limit": MAX_VIEWPORT_ITEMS + 1}),
+        "inspirations_within?clustered": ("aggregate", cluster_pipeline(viewport_filter(-180.0, -85.0, 180.0, 85.0), 2, MAX_CLUSTERS + 1)),
+    }
+
+async def bootstrap_indexes(strict: bool = False) -> Dict[str, List[str]]:
+    await ensure_indexes(db)
+    return await verify_query_plans(db, _query_plan_probes(), strict=strict)
+
+async def _verify_plans(mode: str) -> None:
+    try:
+        await verify_query_plans(db, _query_plan_probes(), strict=mode == 'strict')
+    except Exception:
+        if mode == 'strict':
+            raise
+        logger.exception("Query plan verification failed; continuing without it")
+
+SUMMARY_BOOTSTRAP_LOCK = "summary_bootstrap"
+# A lock older than this belongs to a worker that died mid-rebuild
+STARTUP_LOCK_STALE = 600
+
+async def _startup_summaries() -> None:
+    """First boot after upgrading: materialize summaries from existing inspirations.
+
+    Awaited before serving, so the rebuild's ReplaceOne writes cannot clobber
+    live ``$inc`` updates, and run by one worker only: the rest wait for the
+    lock to go away.
+    """
+    try:
+        while True:
+            if await db.collection_summaries.estimated_document_count() > 0:
+                return
+            now = datetime.utcnow()
+            await db.startup_locks.delete_one({"_id": SUMMARY_BOOTSTRAP_LOCK, "at": {"$lt": now - timedelta(seconds=STARTUP_LOCK_STALE)}})
+            try:
+                await db.startup_locks.insert_one({"_id": SUMMARY_BOOTSTRAP_LOCK, "at": now, "pid": os.getpid()})
+                break
+            except DuplicateKeyError:
+                # Another worker is rebuilding; wait for it (or for its lock to go stale)
+                while await db.startup_locks.find_one({"_id": SUMMARY_BOOTSTRAP_LOCK}) is not None:
+                    if datetime.utcnow() - now > timedelta(seconds=STARTUP_LOCK_STALE):
+                        break
+                    await asyncio.sleep(0.5)
+                else:
+                    return
+        try:
+            rebuilt = await refresh_summaries()
+            logger.info("Materialized collection summaries for %d countries", rebuilt)
+        finally:
+            await db.startup_locks.delete_one({"_id": SUMMARY_BOOTSTRAP_LOCK})
+    except Exception:
+        logger.exception("Collection summary bootstrap failed")
+
+async def _flush_metrics() -> None:
+    while True:
+        await asyncio.sleep(float(os.environ.get('METRICS_FLUSH_SECONDS', '5')))
+        try:
+            registry.flush()
+        except OSError:
+            logger.exception("Could not write metrics for aggregation")
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    open_resources()
+    # Not optional: dedupe (unique), geo (2dsphere), search (text) and status
+    # retention (TTL) depend on these, so no request is served before they exist
+    await ensure_indexes(db)
+    event_hub.start()
+    # QUERY_PLAN_CHECK only governs the explain step: "warn" (default) logs
+    # COLLSCANs in the background, "strict" refuses to start, "off" skips it
+    mode = os.environ.get('QUERY_PLAN_CHECK', 'warn').lower()
+    if mode == 'strict':
+        await _verify_plans(mode)
+    await _startup_summaries()
+    background = []
+    if registry.directory:
+        background.append(asyncio.ensure_future(_flush_metrics()))
+    if mode == 'warn':
+        background.append(asyncio.ensure_future(_verify_plans(mode)))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await close_resources()
+
+def create_app() -> FastAPI:
+    """Application factory: ``uvicorn --factory server:create_app`` or gunicorn ``'server:create_app()'``.
+
+    Building the app opens no connections; the lifespan does, per worker.
+    """
+    load_dotenv(ROOT_DIR / '.env')
+    application = FastAPI(lifespan=lifespan)
+    application.include_router(api_router)
+    application.include_router(root_router)
+
+    # JSON bodies of at least COMPRESS_MIN_BYTES go out gzip/brotli encoded (0 disables)
+    compress_min_bytes = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+    if compress_min_bytes > 0:
+        application.add_middleware(CompressionMiddleware, minimum_size=compress_min_bytes)
+
+    application.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified"],
+    )
+
+    # Added last so it is outermost and also times CORS handling; SERVER_TIMING=1 adds a Server-Timing header
+    application.add_middleware(MetricsMiddleware, server_timing=os.environ.get('SERVER_TIMING', '0') == '1')
+    return application
+
+def __getattr__(name: str) -> Any:
+    # ``uvicorn server:app`` keeps working, but importing this module (manage.py,
+    # benchmarks, a gunicorn master) does not build an app it will not serve
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
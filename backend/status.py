@@ -0,0 +1,184 @@
+"""Status check retention, listing indexes and per-client rollups.
+
+Raw checks in ``status_checks`` expire through a TTL index on ``timestamp``
+(``STATUS_RETENTION_DAYS``, default 30). Every check also bumps one
+``status_rollups`` document per client for each window it falls in::
+
+    {
+        "_id": "hour:2026-10-17T20:00:00:<key>",
+        "window": "hour",
+        "bucket": ISODate("2026-10-17T20:00:00"),
+        "client_name": "web",
+        "count": 12,
+        "last_seen": ISODate("2026-10-17T20:41:09"),
+    }
+
+so ``GET /api/status/stats`` reads at most clients x buckets small
+documents however many raw checks there are. Rollups are kept longer
+(``STATUS_ROLLUP_RETENTION_DAYS``, default 400) and can be rebuilt from the
+raw checks that are still retained (``python manage.py rebuild-status-rollups``).
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, TYPE_CHECKING
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# "Index with the same name but different options": an existing TTL index whose expiry changed
+INDEX_OPTIONS_CONFLICT = 85
+
+STATUS_INDEXES = [
+    # Listing, newest first, keyset-paginated on (timestamp, _id)
+    IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)], name="timestamp_id"),
+    IndexModel([("client_name", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="client_timestamp_id"),
+]
+ROLLUP_INDEXES = [IndexModel([("window", ASCENDING), ("bucket", DESCENDING)], name="window_bucket")]
+REBUILD_BATCH_SIZE = 1000
+
+
+def retention_seconds(env: Mapping[str, str] = os.environ) -> Dict[str, int]:
+    return {
+        "status_checks": int(float(env.get("STATUS_RETENTION_DAYS", "30")) * 86400),
+        "status_rollups": int(float(env.get("STATUS_ROLLUP_RETENTION_DAYS", "400")) * 86400),
+    }
+
+
+def bucket_start(at: datetime, window: str) -> datetime:
+    if window == "day":
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def _rollup_id(window: str, bucket: datetime, client_name: str) -> str:
+    # Client names are user input; the hash keeps the _id bounded
+    return f"{window}:{bucket.isoformat()}:{hashlib.sha1(client_name.encode()).hexdigest()[:16]}"
+
+
+async def _ensure_ttl(db: "AsyncIOMotorDatabase", collection: str, field: str, seconds: int) -> str:
+    name = f"{field}_ttl"
+    index = IndexModel([(field, ASCENDING)], name=name, expireAfterSeconds=seconds)
+    try:
+        await db[collection].create_indexes([index])
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        # Retention was changed: adjust the expiry in place instead of rebuilding the index
+        await db.command({"collMod": collection, "index": {"name": name, "expireAfterSeconds": seconds}})
+        logger.info("Changed %s retention to %ds", collection, seconds)
+    return name
+
+
+async def ensure_status_indexes(db: "AsyncIOMotorDatabase") -> List[str]:
+    retention = retention_seconds()
+    names = await db.status_checks.create_indexes(STATUS_INDEXES)
+    names.append(await _ensure_ttl(db, "status_checks", "timestamp", retention["status_checks"]))
+    names += await db.status_rollups.create_indexes(ROLLUP_INDEXES)
+    names.append(await _ensure_ttl(db, "status_rollups", "bucket", retention["status_rollups"]))
+    return names
+
+
+def _rollup_update(client_name: str, at: datetime, window: str, count: int = 1) -> UpdateOne:
+    bucket = bucket_start(at, window)
+    return UpdateOne(
+        {"_id": _rollup_id(window, bucket, client_name)},
+        {
+            "$setOnInsert": {"window": window, "bucket": bucket, "client_name": client_name},
+            "$inc": {"count": count},
+            "$max": {"last_seen": at},
+        },
+        upsert=True,
+    )
+
+
+async def record_check(db: "AsyncIOMotorDatabase", client_name: str, at: datetime) -> None:
+    await db.status_rollups.bulk_write([_rollup_update(client_name, at, w) for w in WINDOWS], ordered=False)
+
+
+async def client_stats(
+    db: "AsyncIOMotorDatabase",
+    window: str,
+    since: datetime,
+    client_name: Optional[str] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Per-client totals and buckets since ``since``, most recently seen clients first."""
+    match: Dict[str, Any] = {"window": window, "bucket": {"$gte": bucket_start(since, window)}}
+    if client_name is not None:
+        match["client_name"] = client_name
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"bucket": 1}},
+        {"$group": {
+            "_id": "$client_name",
+            "count": {"$sum": "$count"},
+            "last_seen": {"$max": "$last_seen"},
+            "buckets": {"$push": {"start": "$bucket", "count": "$count", "last_seen": "$last_seen"}},
+        }},
+        {"$sort": {"last_seen": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+    return [
+        {"client_name": doc["_id"], "count": doc["count"], "last_seen": doc["last_seen"], "buckets": doc["buckets"]}
+        async for doc in db.status_rollups.aggregate(pipeline)
+    ]
+
+
+async def rebuild_rollups(db: "AsyncIOMotorDatabase") -> int:
+    """Recompute rollups for the period still covered by raw checks; returns documents written.
+
+    Rollups older than the raw retention are left alone, so stats beyond
+    ``STATUS_RETENTION_DAYS`` survive a rebuild.
+    """
+    oldest = await db.status_checks.find_one({}, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+    if oldest is None:
+        return 0
+    expired_before = datetime.utcnow() - timedelta(seconds=retention_seconds()["status_checks"])
+    written = 0
+    for window, width in WINDOWS.items():
+        since = bucket_start(oldest["timestamp"], window)
+        if since < expired_before:
+            # The TTL monitor has already pruned part of this bucket; keep its rollup
+            since += width
+        key = {
+            "client_name": "$client_name",
+            "year": {"$year": "$timestamp"},
+            "month": {"$month": "$timestamp"},
+            "day": {"$dayOfMonth": "$timestamp"},
+        }
+        if window == "hour":
+            key["hour"] = {"$hour": "$timestamp"}
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": since}}},
+            {"$group": {"_id": key, "count": {"$sum": 1}, "last_seen": {"$max": "$timestamp"}}},
+        ]
+        # Clear the rebuilt range first, which also drops buckets that no
+        # longer have any checks; listing the kept ids instead could outgrow
+        # a 16 MB command. Readers briefly see the range empty.
+        await db.status_rollups.delete_many({"window": window, "bucket": {"$gte": since}})
+        ops: List[ReplaceOne] = []
+        async for doc in db.status_checks.aggregate(pipeline, allowDiskUse=True):
+            k = doc["_id"]
+            bucket = datetime(k["year"], k["month"], k["day"], k.get("hour", 0))
+            # Upserts, not inserts: record_check may have recreated a bucket since the delete
+            ops.append(ReplaceOne(
+                {"_id": _rollup_id(window, bucket, k["client_name"])},
+                {"window": window, "bucket": bucket, "client_name": k["client_name"], "count": doc["count"], "last_seen": doc["last_seen"]},
+                upsert=True,
+            ))
+            if len(ops) >= REBUILD_BATCH_SIZE:
+                await db.status_rollups.bulk_write(ops, ordered=False)
+                written += len(ops)
+                ops = []
+        if ops:
+            await db.status_rollups.bulk_write(ops, ordered=False)
+            written += len(ops)
+    return written
@@ -0,0 +1,135 @@
+"""Materialized per-country collection summaries.
+
+One ``collection_summaries`` document per country, maintained with a single
+atomic ``$inc`` on every inspiration write::
+
+    {
+        "_id": "Indonesia",
+        "count": 42,
+        "cities": {"<key>": {"name": "Bali", "count": 30}, ...},
+        "contributors": {"<key>": {"name": "ana", "count": 12}, ...},
+    }
+
+City and contributor names are user input and may contain ``.`` or ``$``, so
+they are stored under a hashed key rather than used as field names.
+Contributors carry a count (the places they saved in that country) so
+removing an inspiration can retract them.
+"""
+import hashlib
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, TYPE_CHECKING, Tuple
+
+from pymongo import DESCENDING, IndexModel, ReplaceOne, UpdateOne
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+SUMMARY_INDEXES = [IndexModel([("count", DESCENDING)], name="count")]
+
+
+def _key(name: str) -> str:
+    return hashlib.sha1(name.encode()).hexdigest()[:16]
+
+
+def _live(entries: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [e for e in (entries or {}).values() if e.get("count", 0) > 0]
+
+
+async def apply_inspiration(db: "AsyncIOMotorDatabase", doc: Dict[str, Any], delta: int = 1) -> None:
+    """Add (``delta=1``) or remove (``delta=-1``) one inspiration from its country summary."""
+    await apply_inspirations(db, [doc], delta)
+
+
+def _contributors(doc: Dict[str, Any]) -> List[str]:
+    return doc.get("contributors") or ([doc["added_by"]] if doc.get("added_by") else [])
+
+
+async def apply_inspirations(db: "AsyncIOMotorDatabase", docs: Iterable[Dict[str, Any]], delta: int = 1) -> None:
+    """Apply a batch of inspirations with one atomic upsert per affected country."""
+    incs: Dict[str, Dict[str, int]] = {}
+    names: Dict[str, Dict[str, str]] = {}
+    for doc in docs:
+        country, city = doc.get("country"), doc.get("city")
+        inc, named = incs.setdefault(country, {}), names.setdefault(country, {})
+        inc["count"] = inc.get("count", 0) + delta
+        inc[f"cities.{_key(city)}.count"] = inc.get(f"cities.{_key(city)}.count", 0) + delta
+        named[f"cities.{_key(city)}.name"] = city
+        for name in _contributors(doc):
+            inc[f"contributors.{_key(name)}.count"] = inc.get(f"contributors.{_key(name)}.count", 0) + delta
+            named[f"contributors.{_key(name)}.name"] = name
+    await _write(db, incs, names, delta)
+
+
+async def apply_contributors(db: "AsyncIOMotorDatabase", joined: Iterable[Tuple[str, str]]) -> None:
+    """Count ``(country, contributor)`` pairs for saves merged into an existing place."""
+    incs: Dict[str, Dict[str, int]] = {}
+    names: Dict[str, Dict[str, str]] = {}
+    for country, name in joined:
+        inc = incs.setdefault(country, {})
+        inc[f"contributors.{_key(name)}.count"] = inc.get(f"contributors.{_key(name)}.count", 0) + 1
+        names.setdefault(country, {})[f"contributors.{_key(name)}.name"] = name
+    await _write(db, incs, names, 1)
+
+
+async def _write(db: "AsyncIOMotorDatabase", incs: Dict[str, Dict[str, int]], names: Dict[str, Dict[str, str]], delta: int) -> None:
+    if not incs:
+        return
+    await db.collection_summaries.bulk_write(
+        [UpdateOne({"_id": c}, {"$inc": incs[c], "$set": names[c]}, upsert=True) for c in incs],
+        ordered=False,
+    )
+    if delta < 0:
+        await db.collection_summaries.delete_many({"_id": {"$in": list(incs)}, "count": {"$lte": 0}})
+
+
+async def rebuild_summaries(db: "AsyncIOMotorDatabase") -> int:
+    """Recompute every country summary from the inspirations collection."""
+    places = [{"$group": {"_id": {"country": "$country", "city": "$city"}, "count": {"$sum": 1}}}]
+    contributors = [
+        # Documents from before contributors were tracked only have added_by
+        {"$project": {"country": 1, "names": {"$cond": [
+            {"$gt": [{"$size": {"$ifNull": ["$contributors", []]}}, 0]},
+            "$contributors",
+            {"$cond": [{"$ifNull": ["$added_by", False]}, ["$added_by"], []]},
+        ]}}},
+        {"$unwind": "$names"},
+        {"$group": {"_id": {"country": "$country", "name": "$names"}, "count": {"$sum": 1}}},
+    ]
+    summaries: Dict[str, Dict[str, Any]] = {}
+
+    def summary(country: str) -> Dict[str, Any]:
+        return summaries.setdefault(country, {"_id": country, "count": 0, "cities": {}, "contributors": {}})
+
+    async for row in db.inspirations.aggregate(places, allowDiskUse=True):
+        country, city = row["_id"].get("country"), row["_id"].get("city")
+        summary(country)["count"] += row["count"]
+        summary(country)["cities"].setdefault(_key(city), {"name": city, "count": 0})["count"] += row["count"]
+    async for row in db.inspirations.aggregate(contributors, allowDiskUse=True):
+        name = row["_id"]["name"]
+        summary(row["_id"].get("country"))["contributors"][_key(name)] = {"name": name, "count": row["count"]}
+    if summaries:
+        await db.collection_summaries.bulk_write([ReplaceOne({"_id": c}, s, upsert=True) for c, s in summaries.items()])
+    await db.collection_summaries.delete_many({"_id": {"$nin": list(summaries)}})
+    return len(summaries)
+
+
+def country_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """A summary document as a ``CountrySummary`` dict."""
+    return {"country": doc["_id"], "count": doc["count"], "contributors": [c["name"] for c in _live(doc.get("contributors"))]}
+
+
+async def country_summaries(db: "AsyncIOMotorDatabase") -> List[Dict[str, Any]]:
+    docs = await db.collection_summaries.find({"count": {"$gt": 0}}).sort("count", DESCENDING).to_list(None)
+    return [country_row(d) for d in docs]
+
+
+async def city_summaries(db: "AsyncIOMotorDatabase", country: str) -> List[Dict[str, Any]]:
+    doc = await db.collection_summaries.find_one({"_id": country}, {"cities": 1})
+    cities = _live(doc.get("cities") if doc else None)
+    return [{"city": c["name"], "count": c["count"]} for c in sorted(cities, key=lambda c: -c["count"])]
+
+
+async def iter_summaries(db: "AsyncIOMotorDatabase", batch_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every country summary including its per-city counts."""
+    async for d in db.collection_summaries.find({"count": {"$gt": 0}}, batch_size=batch_size).sort("count", DESCENDING):
+        cities = sorted(_live(d.get("cities")), key=lambda c: -c["count"])
+        yield {**country_row(d), "cities": [{"city": c["name"], "count": c["count"]} for c in cities]}
@@ -0,0 +1,181 @@
+"""Background image variant generation.
+
+Uploaded originals are resized into ``VARIANTS`` off the event loop in a
+process pool, re-encoded as WebP (JPEG if this Pillow build lacks WebP) with
+EXIF and other metadata dropped, and stored in the image store. Variants are
+recorded once per original digest in ``image_variants`` and copied onto
+every inspiration that uses the original, so list reads need no join.
+
+Workers are started with ``forkserver`` (``spawn`` where that is missing),
+never ``fork``: a child forked from the running event loop would inherit
+the Mongo client's sockets and threads. On shutdown queued work is
+dropped; ``python manage.py generate-thumbnails`` finishes it later.
+"""
+import asyncio
+import functools
+import importlib.util
+import io
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, TYPE_CHECKING, Tuple
+
+from image_store import ImageStore
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Pillow is optional and only imported by the worker processes that use it
+HAVE_PIL = importlib.util.find_spec("PIL") is not None
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels; originals are never upscaled
+VARIANTS = {"thumb": 160, "card": 480, "full": 1600}
+DEFAULT_VARIANT = "card"
+QUALITY = 80
+
+
+
+def _start_method() -> str:
+    import multiprocessing
+
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def render_variants(data: bytes) -> Dict[str, Tuple[bytes, str]]:
+    """Resize one image into every variant. Runs in a worker process."""
+    from PIL import Image, ImageOps, features
+
+    webp = features.check("webp")
+    fmt, mime = ("WEBP", "image/webp") if webp else ("JPEG", "image/jpeg")
+    with Image.open(io.BytesIO(data)) as src:
+        im = ImageOps.exif_transpose(src)
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+        if im.mode == "RGBA" and not webp:
+            im = im.convert("RGB")
+        out: Dict[str, Tuple[bytes, str]] = {}
+        for name, edge in VARIANTS.items():
+            variant = im.copy()
+            variant.thumbnail((edge, edge), Image.LANCZOS)
+            buf = io.BytesIO()
+            # No exif=/icc_profile= arguments: metadata is not carried over
+            variant.save(buf, format=fmt, quality=QUALITY, optimize=True)
+            out[name] = (buf.getvalue(), mime)
+    return out
+
+
+class ThumbnailPipeline:
+    def __init__(
+        self,
+        db: "AsyncIOMotorDatabase",
+        store: ImageStore,
+        max_workers: Optional[int] = None,
+        on_changed: Optional[Callable[[Set[Tuple[str, str]]], Awaitable[None]]] = None,
+    ):
+        self.db = db
+        self.store = store
+        self.max_workers = max_workers
+        # Told the (country, city) places whose inspirations gained variants
+        self.on_changed = on_changed
+        self._pool: Optional["ProcessPoolExecutor"] = None
+        self._pending: Dict[str, List[Optional[Callable[[], Awaitable[None]]]]] = {}
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return HAVE_PIL and self.max_workers != 0
+
+    async def known_variants(self, digest: str) -> Optional[Dict[str, str]]:
+        doc = await self.db.image_variants.find_one({"_id": digest})
+        return doc["variants"] if doc else None
+
+    def submit(self, digest: str, on_done: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        """Schedule variant generation for ``digest``; joins the run already queued for it."""
+        if not self.enabled:
+            return
+        callbacks = self._pending.get(digest)
+        self._pending.setdefault(digest, []).append(on_done)
+        if callbacks is not None:
+            return
+        task = asyncio.ensure_future(self._process(digest))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, digest: str) -> None:
+        try:
+            # Submissions that arrive mid-run get another (cheap) pass so their
+            # freshly inserted inspirations also receive the variants
+            while self._pending[digest]:
+                callbacks, self._pending[digest] = self._pending[digest], []
+                if await self.generate(digest) is None:
+                    break
+                for on_done in callbacks:
+                    if on_done is not None:
+                        await on_done()
+        except Exception:
+            logger.exception("Thumbnailing failed for image %s", digest)
+        finally:
+            del self._pending[digest]
+
+    async def generate(self, digest: str) -> Optional[Dict[str, str]]:
+        variants = await self.known_variants(digest)
+        if variants is None:
+            stored = await self.store.open(digest)
+            if stored is None:
+                return None
+            data = b"".join([chunk async for chunk in stored.chunks])
+            if self._pool is None:
+                # Imported on first render so worker startup does not pay for it
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(_start_method()))
+            rendered = await asyncio.get_running_loop().run_in_executor(self._pool, render_variants, data)
+            variants = {name: await self.store.put(blob, mime) for name, (blob, mime) in rendered.items()}
+            await self.db.image_variants.update_one({"_id": digest}, {"$set": {"variants": variants}}, upsert=True)
+        stale = {"image_ref": digest, "image_variants": {"$ne": variants}}
+        places = {
+            (row["_id"]["country"], row["_id"]["city"])
+            async for row in self.db.inspirations.aggregate([
+                {"$match": stale},
+                {"$group": {"_id": {"country": "$country", "city": "$city"}}},
+            ])
+        }
+        if places:
+            await self.db.inspirations.update_many(stale, {"$set": {"image_variants": variants}})
+            if self.on_changed is not None:
+                await self.on_changed(places)
+        return variants
+
+    async def backfill(self, batch_size: int = 100) -> int:
+        """Generate variants for every stored original that does not have them yet."""
+        pipeline = [
+            {"$match": {"image_ref": {"$ne": None}, "image_variants": {"$exists": False}}},
+            {"$group": {"_id": "$image_ref"}},
+        ]
+        done = 0
+        async for row in self.db.inspirations.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+            try:
+                if await self.generate(row["_id"]) is not None:
+                    done += 1
+            except Exception:
+                logger.exception("Thumbnailing failed for image %s", row["_id"])
+        return done
+
+    async def drain(self) -> None:
+        """Wait until every submitted image has its variants (one-off imports)."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Drop queued work instead of draining it; only renders already running are waited for."""
+        if self._tasks:
+            logger.info("Dropping thumbnailing for %d images; generate-thumbnails will pick them up", len(self._pending))
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            # Joining the workers blocks; keep the loop serving while they exit
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(pool.shutdown, wait=True, cancel_futures=True))
@@ -0,0 +1,65 @@
+"""Per-scope version counters for conditional GETs.
+
+Every write bumps one ``collection_versions`` document for each read scope
+it affects (the response cache tags: ``"all"``, a country, a city), so a read
+route can build its ``ETag`` and ``Last-Modified`` from a single ``_id``
+lookup instead of running its query::
+
+    {"_id": '["city","Indonesia","Bali"]', "version": 7, "updated_at": ISODate(...)}
+"""
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, List, Optional, TYPE_CHECKING
+
+from pymongo import UpdateOne
+
+from cache import Tag
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+@dataclass(frozen=True)
+class Version:
+    number: int = 0
+    updated_at: Optional[datetime] = None
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        if self.updated_at is None:
+            return None
+        return format_datetime(self.updated_at.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+    def modified_since(self, header: str) -> bool:
+        """False when ``If-Modified-Since: header`` is at or after ``updated_at``."""
+        if self.updated_at is None:
+            return True
+        try:
+            since = parsedate_to_datetime(header)
+        except (TypeError, ValueError):
+            return True
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return self.updated_at.replace(tzinfo=timezone.utc, microsecond=0) > since
+
+
+def scope_id(tag: Tag) -> str:
+    # City and country names are user input; JSON keeps the scopes unambiguous
+    return tag if isinstance(tag, str) else json.dumps(list(tag), ensure_ascii=False, separators=(",", ":"))
+
+
+async def bump_versions(db: "AsyncIOMotorDatabase", tags: Iterable[Tag], at: Optional[datetime] = None) -> None:
+    at = at or datetime.utcnow()
+    ops: List[UpdateOne] = [
+        UpdateOne({"_id": scope_id(t)}, {"$inc": {"version": 1}, "$max": {"updated_at": at}}, upsert=True)
+        for t in set(tags)
+    ]
+    if ops:
+        await db.collection_versions.bulk_write(ops, ordered=False)
+
+
+async def current_version(db: "AsyncIOMotorDatabase", tag: Tag) -> Version:
+    doc = await db.collection_versions.find_one({"_id": scope_id(tag)})
+    return Version(doc["version"], doc.get("updated_at")) if doc else Version()
@@ -19,8 +19,13 @@ export type Inspiration = {
   url: string;
   title?: string | null;
   image_base64?: string | null;
+  image_ref?: string | null;
+  image_url?: string | null;
+  image_variants?: Record<string, string>;
   country: string;
   city: string;
+  lat?: number | null;
+  lng?: number | null;
   type: 'activity' | 'cafe';
   theme: string[];
   cost_indicator?: '$' | '$$' | '$$$' | null;
@@ -40,13 +45,64 @@ export async function fetchCities(country: string) {
   return data;
 }
 
+// The server's largest page; list routes return at most this many rows per request
+const MAX_PAGE_SIZE = 1000;
+
+// Every item in the city: follows X-Next-Cursor until the last page
 export async function fetchCityItems(country: string, city: string, type?: 'activity' | 'cafe') {
-  const params = type ? { type } : undefined;
-  const { data } = await api.get<Inspiration[]>(`/city/${encodeURIComponent(country)}/${encodeURIComponent(city)}/items`, { params });
+  const path = `/city/${encodeURIComponent(country)}/${encodeURIComponent(city)}/items`;
+  const items: Inspiration[] = [];
+  let cursor: string | undefined;
+  do {
+    const { data, headers } = await api.get<Inspiration[]>(path, { params: { type, limit: MAX_PAGE_SIZE, cursor } });
+    items.push(...data);
+    cursor = headers['x-next-cursor'] || undefined;
+  } while (cursor);
+  return items;
+}
+
+export type NearbyInspiration = Inspiration & { distance_m: number };
+export type GeoCluster = { lat: number; lng: number; count: number; id?: string | null };
+export type ViewportResult = { clustered: boolean; truncated: boolean; clusters: GeoCluster[]; items: Inspiration[] };
+export type Viewport = { west: number; south: number; east: number; north: number; zoom: number };
+
+export async function fetchNearby(lat: number, lng: number, radius_m = 5000, type?: 'activity' | 'cafe') {
+  const { data } = await api.get<NearbyInspiration[]>('/inspirations/near', { params: { lat, lng, radius_m, type } });
+  return data;
+}
+
+// Below the server's cluster zoom this returns clusters instead of pins
+export async function fetchViewport(viewport: Viewport, type?: 'activity' | 'cafe') {
+  const zoom = Math.max(0, Math.min(22, Math.floor(viewport.zoom)));
+  const { data } = await api.get<ViewportResult>('/inspirations/within', { params: { ...viewport, zoom, type } });
   return data;
 }
 
-export async function addInspiration(payload: Omit<Inspiration, 'id' | 'contributors' | 'created_at'>) {
+export type ChangeFeedHandlers = {
+  onInspirationAdded?: (item: Inspiration) => void;
+  onSummaryChanged?: (summary: CountrySummary) => void;
+  // Events were missed (slow client or expired resume point): refetch what is shown
+  onResync?: () => void;
+};
+
+// Server-Sent Events from /api/stream; the browser resumes with Last-Event-ID on reconnect
+export function subscribeToChanges(handlers: ChangeFeedHandlers, scope: { country?: string; city?: string } = {}) {
+  const params = new URLSearchParams();
+  if (scope.country) params.set('country', scope.country);
+  if (scope.city) params.set('city', scope.city);
+  const query = params.toString();
+  const source = new EventSource(`${API_BASE}/stream${query ? `?${query}` : ''}`);
+  source.addEventListener('inspiration-added', (e) => handlers.onInspirationAdded?.(JSON.parse((e as MessageEvent).data)));
+  source.addEventListener('summary-changed', (e) => handlers.onSummaryChanged?.(JSON.parse((e as MessageEvent).data)));
+  source.addEventListener('resync', () => handlers.onResync?.());
+  return () => source.close();
+}
+
+export function imageSrc(item: Pick<Inspiration, 'image_url' | 'image_base64'>) {
+  return item.image_url ? `${base}${item.image_url}` : item.image_base64 || undefined;
+}
+
+export async function addInspiration(payload: Omit<Inspiration, 'id' | 'contributors' | 'created_at' | 'image_ref' | 'image_url' | 'image_variants'>) {
   const body = {
     url: payload.url,
     title: payload.title || null,
@@ -58,6 +114,8 @@ export async function addInspiration(payload: Omit<Inspiration, 'id' | 'contribu
     cost_indicator: payload.cost_indicator || null,
     vibe_notes: payload.vibe_notes || null,
     added_by: payload.added_by || null,
+    lat: payload.lat ?? null,
+    lng: payload.lng ?? null,
   };
   const { data } = await api.post<Inspiration>('/inspirations', body);
   return data;
@@ -0,0 +1,46 @@
+"""Shared setup: backend modules on the path and mongomock-motor in place of mongod."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "verso_test")
+# GridFS, explain and the thumbnail worker pool are not available against mongomock
+os.environ.update(
+    IMAGE_STORE="local",
+    IMAGE_STORE_DIR=tempfile.mkdtemp(prefix="verso-test-images-"),
+    QUERY_PLAN_CHECK="off",
+    THUMBNAIL_WORKERS="0",
+)
+
+import mongomock_motor  # noqa: E402
+import motor.motor_asyncio  # noqa: E402
+
+# Patched before server.py is imported, which binds the name at import time
+motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mongo_db():
+    return mongomock_motor.AsyncMongoMockClient()["verso_test"]
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import server
+
+    with TestClient(server.create_app()) as c:
+        yield c
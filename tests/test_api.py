@@ -0,0 +1,127 @@
+"""Smoke tests for the routes that run on mongomock.
+
+Geo ($geoNear/$geoWithin), text search and the change stream need a real mongod.
+"""
+import base64
+import gzip
+import hashlib
+import json
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def place(**kw):
+    return {"url": "https://example.com/a", "country": "ID", "city": "Bali", "type": "cafe", **kw}
+
+
+def test_root_and_liveness(client):
+    assert client.get("/api/").json() == {"message": "Verso API"}
+    assert client.get("/api/health/live").json() == {"status": "ok"}
+
+
+def test_readiness_reports_pool(client):
+    body = client.get("/api/health/ready").json()
+    assert {"in_use", "waiting", "utilization"} <= set(body["pool"])
+
+
+def test_save_twice_adds_contributor(client):
+    first = client.post("/api/inspirations", json=place(added_by="ana")).json()
+    second = client.post("/api/inspirations", json=place(url="https://www.example.com/a/?utm_source=x", added_by="ben")).json()
+    assert first["id"] == second["id"]
+    rows = client.get("/api/inspirations").json()
+    assert len(rows) == 1
+    assert sorted(rows[0]["contributors"]) == ["ana", "ben"]
+
+
+def test_summaries_follow_writes(client):
+    client.post("/api/inspirations", json=place())
+    client.post("/api/inspirations", json=place(url="https://example.com/b", city="Ubud"))
+    client.post("/api/inspirations", json=place(url="https://example.com/c", country="FR", city="Paris"))
+
+    summary = {row["country"]: row["count"] for row in client.get("/api/collections/summary").json()}
+    assert summary == {"ID": 2, "FR": 1}
+    cities = {row["city"]: row["count"] for row in client.get("/api/collections/ID/cities").json()}
+    assert cities == {"Bali": 1, "Ubud": 1}
+    assert [r["url"] for r in client.get("/api/city/ID/Ubud/items").json()] == ["https://example.com/b"]
+
+
+def test_conditional_get(client):
+    client.post("/api/inspirations", json=place())
+    r = client.get("/api/city/ID/Bali/items")
+    etag, last_modified = r.headers["etag"], r.headers["last-modified"]
+
+    assert client.get("/api/city/ID/Bali/items", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/city/ID/Bali/items", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    # A write elsewhere leaves this city's ETag alone; a write here changes it
+    client.post("/api/inspirations", json=place(url="https://example.com/b", city="Ubud"))
+    assert client.get("/api/city/ID/Bali/items", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/api/inspirations", json=place(url="https://example.com/c"))
+    r = client.get("/api/city/ID/Bali/items", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert len(r.json()) == 2
+
+
+def test_fields_projection(client):
+    client.post("/api/inspirations", json=place(title="Cafe"))
+    assert client.get("/api/inspirations", params={"fields": "url,title"}).json() == [{"url": "https://example.com/a", "title": "Cafe"}]
+    assert client.get("/api/inspirations", params={"fields": "nope"}).status_code == 400
+
+
+def test_image_round_trip(client):
+    data_uri = "data:text/html;base64," + base64.b64encode(PNG).decode()
+    saved = client.post("/api/inspirations", json=place(image_base64=data_uri)).json()
+    r = client.get(saved["image_url"])
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/png"
+    assert r.headers["x-content-type-options"] == "nosniff"
+    assert r.content == PNG
+
+
+def test_merged_saves_do_not_store_their_image(client):
+    other = PNG + b"\x01"
+    client.post("/api/inspirations", json=place(image_base64=base64.b64encode(PNG).decode()))
+    client.post("/api/inspirations", json=place(image_base64=base64.b64encode(other).decode(), added_by="ben"))
+    row = {**place(image_base64=base64.b64encode(other + b"\x02").decode()), "added_by": "cy"}
+    r = client.post("/api/inspirations/bulk", content=json.dumps(row).encode(), headers={"Content-Type": "application/x-ndjson"})
+    assert r.json()["merged"] == 1
+    assert client.get(f"/api/images/{hashlib.sha256(PNG).hexdigest()}").status_code == 200
+    for blob in (other, other + b"\x02"):
+        assert client.get(f"/api/images/{hashlib.sha256(blob).hexdigest()}").status_code == 404
+
+
+def test_non_image_upload_is_rejected(client):
+    html = "data:image/png;base64," + base64.b64encode(b"<html><script>alert(1)</script></html>").decode()
+    assert client.post("/api/inspirations", json=place(image_base64=html)).status_code == 422
+
+
+def test_bulk_ndjson_and_export(client):
+    lines = [json.dumps(place(url=f"https://example.com/{i}")) for i in range(3)] + ["{not json"]
+    r = client.post("/api/inspirations/bulk", content="\n".join(lines).encode(), headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    result = r.json()
+    assert result["inserted"] == 3
+    assert len(result["errors"]) == 1
+
+    r = client.get("/api/inspirations/export", params={"gzip": "true"})
+    rows = [json.loads(line) for line in gzip.decompress(r.content).splitlines()]
+    assert sorted(row["url"] for row in rows) == [f"https://example.com/{i}" for i in range(3)]
+
+
+def test_status_checks(client):
+    for name in ("web", "web", "ios"):
+        assert client.post("/api/status", json={"client_name": name}).status_code == 200
+
+    r = client.get("/api/status", params={"limit": 2})
+    assert [row["client_name"] for row in r.json()] == ["ios", "web"]
+    older = client.get("/api/status", params={"limit": 2, "cursor": r.headers["x-next-cursor"]}).json()
+    assert [row["client_name"] for row in older] == ["web"]
+
+    stats = client.get("/api/status/stats", params={"window": "day", "buckets": 1}).json()
+    assert {c["client_name"]: c["count"] for c in stats["clients"]} == {"web": 2, "ios": 1}
+
+
+def test_metrics(client):
+    client.get("/api/")
+    body = client.get("/metrics").text
+    assert "verso_http_request_duration_seconds" in body
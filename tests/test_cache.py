@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from cache import ResponseCache, scope_for, write_tags
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = ResponseCache()
+    calls = 0
+    release = asyncio.Event()
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return b"body"
+
+    waiters = [asyncio.ensure_future(cache.get_or_load("k", load, {"all"})) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [b"body"] * 5
+    assert calls == 1
+    assert (cache.stats.misses, cache.stats.coalesced) == (1, 4)
+    assert await cache.get_or_load("k", load) == b"body"
+    assert cache.stats.hits == 1
+
+
+async def test_cancelled_waiter_does_not_abort_shared_load():
+    cache = ResponseCache()
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return b"body"
+
+    first = asyncio.ensure_future(cache.get_or_load("k", load))
+    second = asyncio.ensure_future(cache.get_or_load("k", load))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == b"body"
+    assert len(cache) == 1
+
+
+async def test_invalidation_during_load_answers_waiters_but_does_not_store():
+    cache = ResponseCache()
+    release = asyncio.Event()
+
+    async def stale_load():
+        await release.wait()
+        return b"old"
+
+    waiter = asyncio.ensure_future(cache.get_or_load("k", stale_load, {("city", "ID", "Bali")}))
+    await asyncio.sleep(0)
+    cache.invalidate(write_tags("ID", "Bali"))
+    release.set()
+
+    assert await waiter == b"old"
+    assert len(cache) == 0
+
+    async def fresh_load():
+        return b"new"
+
+    assert await cache.get_or_load("k", fresh_load) == b"new"
+
+
+async def test_invalidate_drops_only_matching_tags():
+    cache = ResponseCache()
+
+    async def value(v):
+        return v
+
+    await cache.get_or_load("bali", lambda: value(b"1"), {scope_for("ID", "Bali")})
+    await cache.get_or_load("paris", lambda: value(b"2"), {scope_for("FR", "Paris")})
+    await cache.get_or_load("countries", lambda: value(b"3"), {scope_for()})
+
+    assert cache.invalidate(write_tags("ID", "Bali")) == 2
+    assert len(cache) == 1
+    assert await cache.get_or_load("paris", lambda: value(b"x")) == b"2"
+
+
+async def test_failed_load_is_not_cached():
+    cache = ResponseCache()
+
+    async def boom():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load("k", boom)
+    assert len(cache) == 0
+
+
+async def test_disabled_cache_always_loads():
+    cache = ResponseCache(ttl=0)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        return b"body"
+
+    await cache.get_or_load("k", load)
+    await cache.get_or_load("k", load)
+    assert calls == 2
+
+
+async def test_total_bytes_bound_evicts_least_recently_used():
+    cache = ResponseCache(max_bytes=250, max_entry_bytes=250)
+
+    async def body(n):
+        return b"x" * n, {}
+
+    await cache.get_or_load("a", lambda: body(100))
+    await cache.get_or_load("b", lambda: body(100))
+    await cache.get_or_load("a", lambda: body(0))
+    await cache.get_or_load("c", lambda: body(100))
+
+    assert cache.snapshot()["bytes"] == 200
+    assert cache.stats.evictions == 1
+    assert await cache.get_or_load("a", lambda: body(1)) == (b"x" * 100, {})
+    assert await cache.get_or_load("b", lambda: body(1)) == (b"x", {})
+
+
+async def test_oversized_value_is_served_not_stored():
+    cache = ResponseCache(max_entry_bytes=10)
+
+    async def big():
+        return b"x" * 11
+
+    assert await cache.get_or_load("k", big) == b"x" * 11
+    assert len(cache) == 0
+    assert cache.stats.too_large == 1
+
+
+async def test_invalidate_releases_bytes():
+    cache = ResponseCache()
+
+    async def body():
+        return b"x" * 10
+
+    await cache.get_or_load("k", body, {"all"})
+    cache.invalidate({"all"})
+    assert cache.snapshot()["bytes"] == 0
+
+
+def test_scope_for():
+    assert scope_for() == "all"
+    assert scope_for("ID") == ("country", "ID")
+    assert scope_for("ID", "Bali") == ("city", "ID", "Bali")
+    assert write_tags("ID", "Bali") == {"all", ("country", "ID"), ("city", "ID", "Bali")}
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+from dedupe import merge_documents, merge_duplicates, normalize_url, upsert_update
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://example.com/a", "https://example.com/a"),
+    ("HTTP://WWW.Example.COM:80/a/", "https://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("https://example.com:8443/a", "https://example.com:8443/a"),
+    ("example.com/a", "https://example.com/a"),
+    ("  example.com/a  ", "https://example.com/a"),
+    ("localhost:8080/a", "https://localhost:8080/a"),
+    ("https://example.com/a?b=2&a=1", "https://example.com/a?a=1&b=2"),
+    ("https://example.com/a?utm_source=x&fbclid=y&id=3#top", "https://example.com/a?id=3"),
+    ("ftp://Files.Example.com/x", "ftp://files.example.com/x"),
+    ("mailto:someone@example.com", "mailto:someone@example.com"),
+    ("MAILTO:someone@example.com", "mailto:someone@example.com"),
+    ("tel:+62123", "tel:+62123"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_normalize_url_rejects_unparsable():
+    with pytest.raises(ValueError):
+        normalize_url("http://[not-ipv6")
+
+
+def test_merge_documents_prefers_keyed_then_oldest():
+    old = {"_id": 1, "created_at": datetime(2024, 1, 1), "contributors": ["ana"], "theme": ["food"]}
+    keyed = {"_id": 2, "created_at": datetime(2025, 1, 1), "url_key": "k", "added_by": "ben", "title": "Cafe"}
+    new = {"_id": 3, "created_at": datetime(2025, 6, 1), "contributors": ["ana", "cy"], "theme": ["food", "view"], "vibe_notes": "quiet"}
+
+    survivor, update = merge_documents([new, old, keyed])
+
+    assert survivor is keyed
+    assert update["contributors"] == ["ben", "ana", "cy"]
+    assert update["theme"] == ["food", "view"]
+    assert update["vibe_notes"] == "quiet"
+    # The survivor's own values are not overwritten
+    assert "title" not in update
+
+
+def test_merge_documents_without_key_keeps_oldest():
+    a = {"_id": 1, "created_at": datetime(2025, 1, 1)}
+    b = {"_id": 2, "created_at": datetime(2024, 1, 1)}
+    survivor, _ = merge_documents([a, b])
+    assert survivor is b
+
+
+def test_upsert_update_adds_contributors():
+    update = upsert_update({"url": "u", "url_key": "k", "contributors": ["ana"]})
+    assert update["$setOnInsert"] == {"url": "u", "url_key": "k"}
+    assert update["$addToSet"] == {"contributors": {"$each": ["ana"]}}
+
+
+def test_upsert_update_anonymous_save_inserts_empty_contributors():
+    update = upsert_update({"url": "u", "contributors": []})
+    assert update == {"$setOnInsert": {"url": "u", "contributors": []}}
+
+
+@pytest.mark.anyio
+async def test_merge_duplicates_survives_bad_urls(mongo_db):
+    place = {"country": "ID", "city": "Bali"}
+    await mongo_db.inspirations.insert_many([
+        {**place, "url": "https://www.example.com/a/", "added_by": "ana", "created_at": datetime(2024, 1, 1)},
+        {**place, "url": "http://example.com/a?utm_source=x", "added_by": "ben", "created_at": datetime(2024, 2, 1)},
+        {**place, "url": "http://[broken", "created_at": datetime(2024, 3, 1)},
+        {**place, "url": "mailto:x@example.com", "created_at": datetime(2024, 3, 1)},
+    ])
+
+    result = await merge_duplicates(mongo_db)
+
+    assert (result.groups, result.removed, result.conflicts) == (1, 1, 0)
+    docs = await mongo_db.inspirations.find({}, {"_id": 0, "url_key": 1, "contributors": 1}).to_list(None)
+    keys = sorted(d["url_key"] for d in docs)
+    assert keys == ["http://[broken", "https://example.com/a", "mailto:x@example.com"]
+    merged = next(d for d in docs if d["url_key"] == "https://example.com/a")
+    assert merged["contributors"] == ["ana", "ben"]
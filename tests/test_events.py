@@ -0,0 +1,101 @@
+"""The change feed in local mode: mongomock has no change streams, so the hub
+falls back to in-process events as it does on a single-worker standalone mongod."""
+import asyncio
+
+import pytest
+
+import events
+from events import INSPIRATION_ADDED, RESYNC, SUMMARY_CHANGED, EventHub
+
+pytestmark = pytest.mark.anyio
+
+
+async def local_hub(db, heartbeat=0.05):
+    hub = EventHub(db, render=lambda doc: {"title": doc.get("title")}, heartbeat=heartbeat)
+    hub.start()
+    while hub.mode == "starting":
+        await asyncio.sleep(0)
+    assert hub.mode == "local"
+    return hub
+
+
+def added(hub, title, country="ID", city="Bali"):
+    hub.publish_inserted([{"country": country, "city": city, "title": title}])
+
+
+async def take(sub, n):
+    """The next ``n`` events, skipping heartbeats."""
+    out = []
+    async for event in sub.events():
+        if event is not None:
+            out.append(event)
+            if len(out) == n:
+                break
+    return out
+
+
+async def test_live_events_are_filtered_by_place(mongo_db):
+    hub = await local_hub(mongo_db)
+    everything, country, city = hub.subscribe(), hub.subscribe("ID"), hub.subscribe("ID", "Bali")
+    added(hub, "a", "ID", "Bali")
+    added(hub, "b", "ID", "Ubud")
+    added(hub, "c", "PT", "Lisbon")
+    await mongo_db.collection_summaries.insert_one({"_id": "ID", "count": 2, "cities": [], "contributors": []})
+    await hub.publish_summaries(["ID"])
+
+    assert [e.data.get("title") for e in await take(everything, 4)] == ["a", "b", "c", None]
+    assert [e.data.get("title") for e in await take(country, 3)] == ["a", "b", None]
+    # A country summary change concerns every city in it
+    assert [(e.type, e.data.get("title")) for e in await take(city, 2)] == [(INSPIRATION_ADDED, "a"), (SUMMARY_CHANGED, None)]
+    await hub.close()
+
+
+async def test_reconnect_replays_after_last_event_id(mongo_db):
+    hub = await local_hub(mongo_db)
+    for title in "abc":
+        added(hub, title)
+    first = hub.recent[0].id
+    sub = hub.subscribe("ID", "Bali", last_event_id=first)
+    added(hub, "d")
+    assert [e.data["title"] for e in await take(sub, 3)] == ["b", "c", "d"]
+    await hub.close()
+
+
+async def test_unknown_last_event_id_gets_a_resync(mongo_db):
+    hub = await local_hub(mongo_db)
+    added(hub, "a")
+    sub = hub.subscribe(last_event_id="local-gone-7")
+    [event] = await take(sub, 1)
+    assert event.type == RESYNC
+    # Points at the newest event, so the next reconnect resumes from there
+    assert event.id == hub.recent[-1].id
+    await hub.close()
+
+
+async def test_heartbeat_while_idle(mongo_db):
+    hub = await local_hub(mongo_db, heartbeat=0.01)
+    stream = hub.subscribe().events()
+    assert await stream.__anext__() is None
+    await hub.close()
+
+
+async def test_slow_subscriber_is_cut_loose_with_a_resync(mongo_db, monkeypatch):
+    monkeypatch.setattr(events, "SUBSCRIBER_BUFFER", 2)
+    hub = await local_hub(mongo_db)
+    slow, other = hub.subscribe(), hub.subscribe("PT")
+    for title in "abc":
+        added(hub, title)
+    assert slow.overflowed and not other.overflowed
+    # The client is told to refetch instead of getting a gap, and the stream ends
+    assert [e.type async for e in slow.events()] == [RESYNC]
+    await hub.close()
+
+
+async def test_close_ends_open_streams(mongo_db):
+    hub = await local_hub(mongo_db, heartbeat=60)
+    subs = [hub.subscribe(), hub.subscribe("ID", "Bali")]
+    readers = [asyncio.ensure_future(take(sub, 1)) for sub in subs]
+    await asyncio.sleep(0)
+    await hub.close()
+    assert await asyncio.wait_for(asyncio.gather(*readers), timeout=1) == [[], []]
+    assert hub._task is None
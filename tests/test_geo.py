@@ -0,0 +1,74 @@
+import pytest
+
+from geo import MAX_LAT, cell_range, cell_size, viewport_filter
+
+
+def polygons(query):
+    clauses = query["$or"] if "$or" in query else [query]
+    return [c["location"]["$geoWithin"]["$geometry"]["coordinates"][0] for c in clauses]
+
+
+def lng_span(ring):
+    lngs = [x for x, _ in ring]
+    return min(lngs), max(lngs)
+
+
+def test_small_viewport_is_one_closed_polygon():
+    (ring,) = polygons(viewport_filter(110.0, -9.0, 116.0, -8.0))
+    assert ring[0] == ring[-1]
+    assert lng_span(ring) == (110.0, 116.0)
+    assert {y for _, y in ring} == {-9.0, -8.0}
+
+
+def test_antimeridian_viewport_is_split_at_180():
+    rings = polygons(viewport_filter(170.0, -20.0, -170.0, -10.0))
+    assert sorted(lng_span(r) for r in rings) == [(-180.0, -170.0), (170.0, 180.0)]
+
+
+def test_wrapped_longitudes_are_normalized():
+    # A map scrolled one world to the east
+    rings = polygons(viewport_filter(470.0, 0.0, 476.0, 1.0))
+    assert [lng_span(r) for r in rings] == [(110.0, 116.0)]
+
+
+def test_wrapped_viewport_crossing_antimeridian():
+    rings = polygons(viewport_filter(-190.0, 0.0, -170.0, 1.0))
+    assert sorted(lng_span(r) for r in rings) == [(-180.0, -170.0), (170.0, 180.0)]
+
+
+def test_whole_world_is_cut_into_strips_and_clamped():
+    rings = polygons(viewport_filter(-400.0, -90.0, 400.0, 90.0))
+    spans = sorted(lng_span(r) for r in rings)
+    assert spans[0][0] == -180.0 and spans[-1][1] == 180.0
+    assert all(hi - lo <= 90.0 for lo, hi in spans)
+    assert {y for r in rings for _, y in r} == {-MAX_LAT, MAX_LAT}
+
+
+@pytest.mark.parametrize("west, east", [(0.0, 120.0), (-60.0, 100.0)])
+def test_wide_edges_are_densified(west, east):
+    for ring in polygons(viewport_filter(west, 0.0, east, 10.0)):
+        xs = sorted({x for x, _ in ring})
+        assert all(b - a <= 10.0 for a, b in zip(xs, xs[1:]))
+
+
+def test_cell_range_snaps_nearby_viewports_together():
+    size = cell_size(4)
+    a = cell_range(100.2, -8.9, 116.1, -0.4, 4)
+    b = cell_range(100.5, -8.5, 115.9, -0.1, 4)
+    assert a == b
+    x0, y0, x1, y1 = a
+    assert x0 * size <= 100.2 and x1 * size >= 116.1
+    assert y0 * size <= -8.9 and y1 * size >= -0.4
+
+
+def test_cell_range_across_antimeridian():
+    x0, _, x1, _ = cell_range(170.0, 0.0, -170.0, 10.0, 3)
+    assert x0 > x1
+    rings = polygons(viewport_filter(x0 * cell_size(3), 0.0, x1 * cell_size(3), 10.0))
+    assert sorted(lng_span(r)[0] for r in rings) == [-180.0, x0 * cell_size(3)]
+
+
+def test_cell_range_near_full_crossing_is_whole_world():
+    size = cell_size(2)
+    x0, _, x1, _ = cell_range(10.0, 0.0, 9.0, 10.0, 2)
+    assert (x0 * size, x1 * size) == (-180.0, 180.0)
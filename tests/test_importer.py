@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from importer import RowError, ndjson_rows
+
+pytestmark = pytest.mark.anyio
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(rows):
+    return [(i, r if isinstance(r, dict) else type(r)) async for i, r in rows]
+
+
+async def test_lines_split_across_chunks():
+    body = b'{"a": 1}\n\n{"a": 2}\r\n{"a"' + b': 3}'
+    for size in (1, 3, len(body)):
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        assert await collect(ndjson_rows(stream(*chunks))) == [(0, {"a": 1}), (1, {"a": 2}), (2, {"a": 3})]
+
+
+async def test_invalid_json_is_a_row_error():
+    assert await collect(ndjson_rows(stream(b'{"a": 1}\n{oops\n{"a": 2}\n'))) == [(0, {"a": 1}), (1, RowError), (2, {"a": 2})]
+
+
+async def test_long_line_is_rejected_and_skipped():
+    long_line = json.dumps({"url": "x" * 100}).encode()
+    chunks = [b'{"a": 1}\n', long_line[:40], long_line[40:80], long_line[80:] + b'\n{"a": 2}\n']
+    assert await collect(ndjson_rows(stream(*chunks), max_line_bytes=50)) == [(0, {"a": 1}), (1, RowError), (2, {"a": 2})]
+
+
+async def test_long_line_in_one_chunk():
+    body = b'{"a": 1}\n' + json.dumps({"url": "x" * 100}).encode() + b'\n{"a": 2}'
+    assert await collect(ndjson_rows(stream(body), max_line_bytes=50)) == [(0, {"a": 1}), (1, RowError), (2, {"a": 2})]
+
+
+async def test_long_unterminated_last_line():
+    assert await collect(ndjson_rows(stream(b'{"a": 1}\n', b"x" * 60, b"x" * 60), max_line_bytes=50)) == [(0, {"a": 1}), (1, RowError)]
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from mongo import PoolMonitor
+
+PRIMARY, SECONDARY = ("db-0", 27017), ("db-1", 27017)
+
+
+def at(address):
+    return SimpleNamespace(address=address)
+
+
+def check_out(monitor, address, n=1):
+    for _ in range(n):
+        monitor.connection_check_out_started(at(address))
+        monitor.connection_checked_out(at(address))
+
+
+def test_pool_monitor_reports_the_busiest_pool():
+    monitor = PoolMonitor(max_pool_size=10)
+    check_out(monitor, PRIMARY, 4)
+    check_out(monitor, SECONDARY, 2)
+    monitor.connection_checked_in(at(PRIMARY))
+    monitor.connection_check_out_started(at(SECONDARY))
+    monitor.connection_check_out_started(at(PRIMARY))
+    monitor.connection_check_out_failed(at(PRIMARY))
+
+    assert monitor.snapshot() == {
+        "in_use": 3,
+        "waiting": 0,
+        "in_use_total": 5,
+        "waiting_total": 1,
+        "pools": 2,
+        "max_pool_size": 10,
+        "utilization": 0.3,
+        "checkout_failures": 1,
+    }
+
+    # A closed pool drops out; the other one is now the busiest
+    monitor.pool_closed(at(PRIMARY))
+    snapshot = monitor.snapshot()
+    assert (snapshot["in_use"], snapshot["waiting"], snapshot["in_use_total"], snapshot["pools"]) == (2, 1, 2, 1)
+    assert snapshot["utilization"] == 0.2
+
+
+def test_pool_monitor_without_traffic():
+    snapshot = PoolMonitor(max_pool_size=0).snapshot()
+    assert snapshot["pools"] == 0
+    assert snapshot["in_use"] == snapshot["waiting"] == 0
+    assert snapshot["utilization"] == 0.0
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from server import NEXT_CURSOR_HEADER, _decode_cursor, _encode_cursor
+
+
+def test_cursor_round_trip():
+    doc = {"_id": ObjectId(), "created_at": datetime(2026, 10, 17, 20, 41, 9, 123000)}
+    cursor = _encode_cursor(doc)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == {"$or": [
+        {"created_at": {"$lt": doc["created_at"]}},
+        {"created_at": doc["created_at"], "_id": {"$lt": doc["_id"]}},
+    ]}
+
+
+def test_cursor_on_another_field():
+    doc = {"_id": ObjectId(), "timestamp": datetime(2026, 10, 17)}
+    assert _decode_cursor(_encode_cursor(doc, "timestamp"), "timestamp")["$or"][0] == {"timestamp": {"$lt": doc["timestamp"]}}
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "bnVsbA", "WyJ4IiwgInkiXQ"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        _decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+def save(client, n, **place):
+    for i in range(n):
+        r = client.post("/api/inspirations", json={"url": f"https://example.com/{i}", "country": "ID", "city": "Bali", "type": "cafe", **place})
+        assert r.status_code == 200, r.text
+
+
+def pages(client, path, limit):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        r = client.get(path, params=params)
+        assert r.status_code == 200
+        seen.append([row["url"] for row in r.json()])
+        cursor = r.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize("n, limit, sizes", [
+    (5, 2, [2, 2, 1]),
+    # An exact multiple ends without an empty trailing page
+    (4, 2, [2, 2]),
+    (3, 5, [3]),
+    (0, 2, [0]),
+])
+def test_pages_cover_everything_once(client, n, limit, sizes):
+    save(client, n)
+    got = pages(client, "/api/inspirations", limit)
+    assert [len(p) for p in got] == sizes
+    flat = [u for p in got for u in p]
+    # Newest first, no duplicates or gaps even when created_at ties
+    assert flat == [f"https://example.com/{i}" for i in reversed(range(n))]
+
+
+def test_city_items_pages(client):
+    save(client, 3)
+    save(client, 2, city="Ubud")
+    assert [len(p) for p in pages(client, "/api/city/ID/Bali/items", 2)] == [2, 1]
+
+
+def test_bad_cursor_over_http(client):
+    assert client.get("/api/inspirations", params={"cursor": "garbage"}).status_code == 400
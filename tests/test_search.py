@@ -0,0 +1,14 @@
+from search import FACET_FIELDS, MAX_SEARCH_MATCHES, search_pipeline
+
+
+def test_facets_only_see_top_matches():
+    pipeline = search_pipeline("cafe", {"country": "ID"}, offset=40, limit=20)
+    stages = [next(iter(stage)) for stage in pipeline]
+    assert stages == ["$match", "$addFields", "$sort", "$limit", "$facet"]
+    assert pipeline[0]["$match"] == {"$text": {"$search": "cafe"}, "country": "ID"}
+    assert pipeline[2]["$sort"] == {"_score": -1, "_id": -1}
+    assert pipeline[3]["$limit"] == MAX_SEARCH_MATCHES
+
+    facet = pipeline[4]["$facet"]
+    assert set(facet) == {"items", "total", *FACET_FIELDS}
+    assert facet["items"][:2] == [{"$skip": 40}, {"$limit": 20}]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from status import bucket_start, client_stats, rebuild_rollups, record_check
+
+
+def test_bucket_start():
+    at = datetime(2026, 10, 17, 20, 41, 9, 123)
+    assert bucket_start(at, "hour") == datetime(2026, 10, 17, 20)
+    assert bucket_start(at, "day") == datetime(2026, 10, 17)
+
+
+@pytest.mark.anyio
+async def test_client_stats_buckets_and_order(mongo_db):
+    base = datetime(2026, 10, 17, 20, 0)
+    for minutes in (1, 5, 65):
+        await record_check(mongo_db, "web", base + timedelta(minutes=minutes))
+    await record_check(mongo_db, "ios", base + timedelta(minutes=30))
+
+    hourly = await client_stats(mongo_db, "hour", base)
+    assert [c["client_name"] for c in hourly] == ["web", "ios"]
+    web = hourly[0]
+    assert web["count"] == 3
+    assert web["last_seen"] == base + timedelta(minutes=65)
+    assert [(b["start"], b["count"]) for b in web["buckets"]] == [(base, 2), (base + timedelta(hours=1), 1)]
+
+    daily = await client_stats(mongo_db, "day", base, client_name="ios")
+    assert [(c["client_name"], c["count"], len(c["buckets"])) for c in daily] == [("ios", 1, 1)]
+
+    assert await client_stats(mongo_db, "hour", base + timedelta(hours=1), limit=1) == [
+        {"client_name": "web", "count": 1, "last_seen": base + timedelta(minutes=65),
+         "buckets": [{"start": base + timedelta(hours=1), "count": 1, "last_seen": base + timedelta(minutes=65)}]},
+    ]
+
+
+@pytest.mark.anyio
+async def test_rebuild_rollups_matches_recorded(mongo_db):
+    now = bucket_start(datetime.utcnow(), "hour")
+    for i, name in enumerate(["web", "web", "ios"]):
+        at = now - timedelta(minutes=10 * i + 1)
+        await mongo_db.status_checks.insert_one({"client_name": name, "timestamp": at})
+        await record_check(mongo_db, name, at)
+    recorded = await client_stats(mongo_db, "hour", now - timedelta(hours=2))
+    await mongo_db.status_rollups.update_many({}, {"$set": {"count": 99}})
+
+    await rebuild_rollups(mongo_db)
+
+    assert await client_stats(mongo_db, "hour", now - timedelta(hours=2)) == recorded
@@ -0,0 +1,77 @@
+import io
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+from image_store import LocalImageStore  # noqa: E402
+from thumbnails import VARIANTS, ThumbnailPipeline, render_variants  # noqa: E402
+
+ORIENTATION, MAKE = 0x0112, 0x010F
+
+
+def jpeg(size, orientation=None):
+    im = Image.new("RGB", size, (200, 80, 40))
+    exif = Image.Exif()
+    exif[MAKE] = "Test camera"
+    if orientation:
+        exif[ORIENTATION] = orientation
+    buf = io.BytesIO()
+    im.save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def test_variants_are_resized_and_stripped():
+    # Orientation 6: stored landscape, displayed portrait
+    rendered = render_variants(jpeg((2000, 1000), orientation=6))
+    assert set(rendered) == set(VARIANTS)
+    for name, (blob, mime) in rendered.items():
+        with Image.open(io.BytesIO(blob)) as im:
+            assert im.format == {"image/webp": "WEBP", "image/jpeg": "JPEG"}[mime]
+            assert im.size == (VARIANTS[name] // 2, VARIANTS[name])
+            assert "exif" not in im.info
+            assert not im.getexif()
+
+
+def test_small_originals_are_not_upscaled():
+    rendered = render_variants(jpeg((300, 200)))
+    sizes = {name: Image.open(io.BytesIO(blob)).size for name, (blob, _) in rendered.items()}
+    assert sizes == {"thumb": (160, 107), "card": (300, 200), "full": (300, 200)}
+
+
+@pytest.mark.anyio
+async def test_generate_updates_every_inspiration_sharing_the_original(mongo_db, tmp_path):
+    store = LocalImageStore(tmp_path)
+    digest = await store.put(jpeg((800, 600)), "image/jpeg")
+    await mongo_db.inspirations.insert_many([
+        {"country": "ID", "city": "Bali", "image_ref": digest},
+        {"country": "ID", "city": "Ubud", "image_ref": digest},
+        {"country": "PT", "city": "Lisbon", "image_ref": "other"},
+    ])
+    changed = []
+
+    async def on_changed(places):
+        changed.append(places)
+
+    pipeline = ThumbnailPipeline(mongo_db, store, max_workers=1, on_changed=on_changed)
+    try:
+        variants = await pipeline.generate(digest)
+        assert set(variants) == set(VARIANTS)
+        for ref in variants.values():
+            assert await store.exists(ref)
+        assert await pipeline.known_variants(digest) == variants
+        rows = await mongo_db.inspirations.find({}, {"_id": 0, "city": 1, "image_variants": 1}).sort("city").to_list(None)
+        assert rows == [
+            {"city": "Bali", "image_variants": variants},
+            {"city": "Lisbon"},
+            {"city": "Ubud", "image_variants": variants},
+        ]
+        assert changed == [{("ID", "Bali"), ("ID", "Ubud")}]
+
+        # Already up to date: nothing rendered, nobody told
+        assert await pipeline.generate(digest) == variants
+        assert len(changed) == 1
+        assert await pipeline.generate("0" * 64) is None
+    finally:
+        await pipeline.close()
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+
+from server import _etag_matches
+from versions import Version, bump_versions, current_version
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('W/"3-abc"', True),
+    ('"3-abc"', True),
+    ('"1-abc", W/"3-abc"', True),
+    ('W/"4-abc"', False),
+    ('W/"3-abd"', False),
+])
+def test_etag_matches(header, expected):
+    assert _etag_matches(header, 'W/"3-abc"') is expected
+
+
+def test_last_modified_is_http_date():
+    version = Version(2, datetime(2026, 10, 17, 20, 41, 9, 500000))
+    assert version.last_modified == "Sat, 17 Oct 2026 20:41:09 GMT"
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("Sat, 17 Oct 2026 20:41:09 GMT", False),
+    ("Sat, 17 Oct 2026 20:41:10 GMT", False),
+    ("Sat, 17 Oct 2026 20:41:08 GMT", True),
+    ("not a date", True),
+])
+def test_modified_since(header, expected):
+    # Sub-second precision is dropped, as it is in Last-Modified
+    version = Version(2, datetime(2026, 10, 17, 20, 41, 9, 500000))
+    assert version.modified_since(header) is expected
+
+
+def test_never_written_scope_is_always_modified():
+    assert Version().last_modified is None
+    assert Version().modified_since("Sat, 17 Oct 2026 20:41:09 GMT") is True
+
+
+@pytest.mark.anyio
+async def test_bump_versions_counts_per_scope(mongo_db):
+    at = datetime(2026, 10, 17, 20, 0)
+    await bump_versions(mongo_db, ["all", ("city", "ID", "Bali")], at)
+    await bump_versions(mongo_db, ["all"], datetime(2026, 10, 17, 19, 0))
+
+    assert await current_version(mongo_db, "all") == Version(2, at)
+    assert await current_version(mongo_db, ("city", "ID", "Bali")) == Version(1, at)
+    assert await current_version(mongo_db, ("city", "ID", "Ubud")) == Version()